@@ -1,170 +1,262 @@
-#!/usr/bin/python
-#-*- coding: utf-8 -*-
-__author__ = 'forestkeep21@naver.com'
-
-import re
-import sys
-import os
-
-from Levenshtein import editops
-# 해당 라이브러리 도큐먼트
-# https://rawgit.com/ztane/python-Levenshtein/master/docs/Levenshtein.html
-
-BASE_DIR = os.path.dirname(sys.executable)
-
-#for debug
-BASE_DIR = os.path.dirname(os.path.realpath(__file__))
-
-
-def seq_validator(data):
-    # 문자열이 시퀀스인지 판별. 판별 끝난 후 비교를 쉽게 하기 위해 모두 대문자로 변환한다.
-    # 읽어들인 문자열이 a,A,T,t,C,c,G,g,N,n이라면 valid. 다른게 포함되어 있다면 invalid.
-    m = re.findall(r'^[A|a|T|t|C|c|G|g|N|n]+$', data.strip())
-    return m[0].upper() if m else None
-
-
-def count_line_in_file(file_name):
-    # 파일내 라인 카운터
-    count = 0
-    for line in open(file_name, 'r'):
-        count += 1
-    return count
-
-
-def do(input_file_name, backward_target_length, dest_folder_path):
-    cur_cnt = 0
-    target_cnt = count_line_in_file(input_file_name)
-    final_results = {}
-
-    for target_set in open(input_file_name, 'r'):
-        # 인풋 파일은 이름 : 와일드시퀀스 : 타겟 의 형태를 띈다.
-        tmp = target_set.split(':')
-        # 파일이름에 화이트스페이스 제거
-        file_name_no_ext = tmp[0].strip()
-        # 파일이름에 확장자 추가
-        file_name = '{}.txt'.format(file_name_no_ext)
-        # 와일드 시퀸스에 화이트 스페이스 제거
-        wild_seq = tmp[1].strip()
-        # 타겟 시퀸스에 화이트 스페이스 제거
-        target = tmp[2].strip()
-
-        # 타겟 시퀸스 valid 검사
-        target = seq_validator(target)
-        if not target:
-            continue
-
-        # 와일드 시퀀스 valid 검사
-        wild_seq = seq_validator(wild_seq)
-        if not wild_seq:
-            continue
-
-        # 결과 저장용 폴더 생성
-        result_folder_name = os.path.join(BASE_DIR, 'analyse_results')
-        if not os.path.exists(result_folder_name):
-                os.makedirs(result_folder_name)
-
-        try:
-            # 결과 임시 저장 dict
-            result = {
-                'total_cnt': count_line_in_file(os.path.join(dest_folder_path, file_name)),
-                'mutated_cnt': 0,
-                'mutated_rates': 0.0,
-                'mutated_dict': {}
-            }
-
-            for line in open(os.path.join(dest_folder_path, file_name), 'r'):
-                # 대상 시퀀스 valid 검사
-                line = seq_validator(line)
-                if not line:
-                    continue
-
-                # 와일드 시퀀스와 타겟을 이용하여 와일드 시퀀스에서 타겟의 시작, 종료 위치를 파악한다. editops에서 사용.
-                target_start_pos_in_wild = int(wild_seq.find(target))
-                target_end_pos = target_start_pos_in_wild + len(target)
-
-                # 와일드 시퀀스를 기준으로 대상 시퀀스와 비교하여 레벤슈타인 유사도 측정에서 editops를 뽑아낸다.
-                # editops는 (변형방법, 와일드시퀀스 기준 위치, 대상시퀀스 기준 위치) 의 형태로 결과가 나온다.
-                # 예를 들어, editops('test', 'teaasz') 의 경우 [('insert', 2, 2), ('insert', 2, 3), ('replace', 3, 5)]
-                # 1번 인덱스 : 삽입이 와일드시퀀스 기준 2번째, 대상시퀀스 기준 2번째에서 발생
-                # 2번 인덱스 : 삽입이 와일드시퀀스 기준 2번째, 대상시퀀스 기준 3번째에서 발생
-                # 3번 인덱스 : 교체가 와일드시퀀스 기준 3번째, 대상시퀀스 기준 5번째에서 발생
-                # 때문에 와일드시퀀스에서 타겟의 위치만 정확히 파악한다면 대상시퀀스에서 변형이 어느부분에 일어났는지
-                # 몰라도 사용자가 지정한 위치에서의 변형 여부를 충분히 잡아낼 수 있다.
-                for mutation_info in editops(wild_seq, line):
-                    # 사용자 지정 위치 검사(타겟의 뒤에서부터 backward_target_length 번째까지)
-                    if target_end_pos - int(backward_target_length) <= mutation_info[1] <= target_end_pos:
-                        # 교체는 변형으로 치지 않는다.
-                        # 또한 교체가 아니면서 대상시퀸스의 문자 N이라면 변형으로 치지않는다.
-                        if mutation_info[0] != 'replace' and line[mutation_info[2]] != 'N':
-                            # 여기까지 왔다면 변형으로 쳐서 카운트+1
-                            result['mutated_cnt'] += 1
-                            # 변형된 대상시퀀스를 결과 출력을 위해 저장하고 동일 시퀀스 갯수 조사를 위해 카운팅한다.
-                            if line not in result['mutated_dict'].keys():
-                                result['mutated_dict'][line] = 1
-                            else:
-                                result['mutated_dict'][line] += 1
-                            break
-
-            # 변형 퍼센티지 계산
-            try:
-                result['mutated_rates'] = float(result['mutated_cnt']) / result['total_cnt'] * 100
-            except:
-                result['mutated_rates'] = 0
-
-            # 각 결과값 저장.
-            with open(os.path.join(result_folder_name, file_name), 'w') as f:
-                f.write('{}\n'.format(wild_seq))
-                f.write('--------\n')
-                for mutated_seq, cnt in result['mutated_dict'].items():
-                    f.write('{} X {}\n'.format(mutated_seq, cnt))
-                f.write('--------\n')
-                f.write('mutation rates : {} %'.format(result['mutated_rates']))
-
-        except Exception as e:
-            print e
-            print file_name, ' not found.'
-            pass
-        else:
-            # 문제 없다면 결과물을 모은다.
-            final_results[file_name_no_ext] = result
-
-        # 타겟 하나 분석 종료 카운트+1
-        cur_cnt += 1
-        # 진행율 화면 표시
-        progress_percentage = float(cur_cnt) / target_cnt * 100
-        print '{} % done'.format(progress_percentage)
-
-        # 최종 결과물 파일 저장.
-        with open(os.path.join(result_folder_name, 'result_info.txt'), 'w') as f:
-            for name, data in final_results.items():
-                f.write('{} : {} : {}/{}\n'.format(name, data['mutated_rates'], data['mutated_cnt'], data['total_cnt']))
-
-if __name__ == '__main__':
-    print u'Input file name with extension: '
-    # 이름 : 와일드시퀀스 : 타겟 으로 구성된 파일을 입력받는다.
-    input_file_name = raw_input()
-    input_file_name = os.path.join(BASE_DIR, input_file_name)
-
-    if not os.path.isfile(input_file_name):
-        print u'File Not Found. Check it is in same folder'
-        raise
-
-    print u'Input length to check mutation from backward of target: '
-    # 사용자 지정 위치를 입력받는다. 타겟의 제일 위에서부터 ~번째이다.
-    backward_target_length = raw_input()
-
-    print u'Input result folder name: '
-    # 추출기가 뽑아낸 대상시퀀스들이 모여있는 폴더 이름 입력.
-    dest_folder_name = raw_input()
-    dest_folder_name = os.path.join(BASE_DIR, dest_folder_name)
-
-    if not os.path.isdir(dest_folder_name):
-        print u'Folder Not Found'
-        raise
-
-    # 분석시작
-    do(input_file_name, backward_target_length, dest_folder_name)
-
-    print u'Well done. Press any key'
-    raw_input()
-
+#!/usr/bin/env python3
+#-*- coding: utf-8 -*-
+__author__ = 'forestkeep21@naver.com'
+
+import re
+import sys
+import os
+
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from Levenshtein import editops
+
+from src.analyser.checkpoint import CHECKPOINT_FOLDER_NAME, clear_checkpoint, file_fingerprint, load_checkpoint, \
+    save_target
+from src.reader import read_sample_batches
+# 해당 라이브러리 도큐먼트
+# https://rawgit.com/ztane/python-Levenshtein/master/docs/Levenshtein.html
+
+BASE_DIR = os.path.dirname(sys.executable)
+
+#for debug
+BASE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+
+def seq_validator(data):
+    # 문자열이 시퀀스인지 판별. 판별 끝난 후 비교를 쉽게 하기 위해 모두 대문자로 변환한다.
+    # 읽어들인 문자열이 a,A,T,t,C,c,G,g,N,n이라면 valid. 다른게 포함되어 있다면 invalid.
+    m = re.findall(r'^[A|a|T|t|C|c|G|g|N|n]+$', data.strip())
+    return m[0].upper() if m else None
+
+
+def parse_target_set(target_set):
+    # 인풋 파일은 이름 : 와일드시퀀스 : 타겟 의 형태를 띈다.
+    tmp = target_set.split(':')
+    # 파일이름에 화이트스페이스 제거
+    file_name_no_ext = tmp[0].strip()
+    # 와일드 시퀸스에 화이트 스페이스 제거
+    wild_seq = tmp[1].strip()
+    # 타겟 시퀸스에 화이트 스페이스 제거
+    target = tmp[2].strip()
+
+    # 타겟 시퀸스 valid 검사
+    target = seq_validator(target)
+    if not target:
+        return None
+
+    # 와일드 시퀀스 valid 검사
+    wild_seq = seq_validator(wild_seq)
+    if not wild_seq:
+        return None
+
+    return file_name_no_ext, wild_seq, target
+
+
+def is_window_unchanged(wild_seq, line, window_start, window_end):
+    # 대상 시퀀스가 사용자 지정 위치 앞쪽(또는 뒤쪽) flank 까지 와일드 시퀀스와 그대로 같다면 editops 를 돌리지 않아도 된다.
+    # Levenshtein 은 공통 접두사를 먼저, 그 다음 남은 부분에서 공통 접미사를 잘라내고 가운데만 정렬하므로
+    # editops 의 와일드시퀀스 기준 위치는 항상 [공통 접두사 길이, 와일드 길이 - 공통 접미사 길이] 안에 있다.
+    # 그 범위가 사용자 지정 위치에 걸치지 않는지를 슬라이스 비교 몇 번으로 확인한다.
+    min_len = min(len(wild_seq), len(line))
+
+    # 공통 접두사가 window_end 를 넘는 경우
+    if min_len > window_end and line[:window_end + 1] == wild_seq[:window_end + 1]:
+        return True
+
+    # 공통 접미사가 window_start 앞까지 덮는 경우. 접두사를 먼저 잘라내므로 접두사와 겹치지 않아야 한다.
+    suffix_len = len(wild_seq) - window_start + 1
+    prefix_limit = min_len - suffix_len + 1
+    return (prefix_limit > 0 and line[len(line) - suffix_len:] == wild_seq[len(wild_seq) - suffix_len:]
+            and line[:prefix_limit] != wild_seq[:prefix_limit])
+
+
+def is_mutated(wild_seq, line, target_end_pos, backward_target_length):
+    # 와일드 시퀀스를 기준으로 대상 시퀀스와 비교하여 레벤슈타인 유사도 측정에서 editops를 뽑아낸다.
+    # editops는 (변형방법, 와일드시퀀스 기준 위치, 대상시퀀스 기준 위치) 의 형태로 결과가 나온다.
+    # 예를 들어, editops('test', 'teaasz') 의 경우 [('insert', 2, 2), ('insert', 2, 3), ('replace', 3, 5)]
+    # 1번 인덱스 : 삽입이 와일드시퀀스 기준 2번째, 대상시퀀스 기준 2번째에서 발생
+    # 2번 인덱스 : 삽입이 와일드시퀀스 기준 2번째, 대상시퀀스 기준 3번째에서 발생
+    # 3번 인덱스 : 교체가 와일드시퀀스 기준 3번째, 대상시퀀스 기준 5번째에서 발생
+    # 때문에 와일드시퀀스에서 타겟의 위치만 정확히 파악한다면 대상시퀀스에서 변형이 어느부분에 일어났는지
+    # 몰라도 사용자가 지정한 위치에서의 변형 여부를 충분히 잡아낼 수 있다.
+    window_start = target_end_pos - backward_target_length
+    if is_window_unchanged(wild_seq, line, window_start, target_end_pos):
+        return False
+
+    for mutation_info in editops(wild_seq, line):
+        # 사용자 지정 위치 검사(타겟의 뒤에서부터 backward_target_length 번째까지)
+        if window_start <= mutation_info[1] <= target_end_pos:
+            # 교체는 변형으로 치지 않는다.
+            # 또한 교체가 아니면서 대상시퀸스의 문자 N이라면 변형으로 치지않는다.
+            if mutation_info[0] != 'replace' and line[mutation_info[2]] != 'N':
+                return True
+    return False
+
+
+def analyse_target(file_name_no_ext, wild_seq, target, backward_target_length, dest_folder_path, result_folder_name,
+                   checkpoint_folder=None):
+    # 타겟 하나를 분석하고 결과 파일을 쓴다. 워커 프로세스에서 돌기 때문에 실패하면 None 을 돌려준다.
+    # checkpoint_folder 가 있으면 끝난 결과를 바로 남겨서 다시 돌릴 때 건너뛸 수 있게 한다.
+    # 파일이름에 확장자 추가
+    file_name = '{}.txt'.format(file_name_no_ext)
+    sample_path = os.path.join(dest_folder_path, file_name)
+    try:
+        # 결과 임시 저장 dict
+        result = {
+            'total_cnt': 0,
+            'mutated_cnt': 0,
+            'mutated_rates': 0.0,
+            'mutated_dict': {}
+        }
+
+        # 와일드 시퀀스와 타겟을 이용하여 와일드 시퀀스에서 타겟의 시작, 종료 위치를 파악한다. editops에서 사용.
+        target_start_pos_in_wild = int(wild_seq.find(target))
+        target_end_pos = target_start_pos_in_wild + len(target)
+
+        # 샘플 파일은 한 번만 읽으면서 전체 라인 수를 세고, 정렬된 샘플 파일은 같은 read 가 대부분이므로
+        # 고유 read 별로 갯수를 센다. Counter 는 처음 나온 순서를 유지하므로 mutated_dict 의 순서도 그대로이다.
+        # 검사와 대문자 변환은 bytes 상태에서 하고, 고유 read 만 str 로 바꾼다.
+        read_counts = Counter()
+        for batch in read_sample_batches(sample_path):
+            result['total_cnt'] += len(batch)
+            read_counts.update(batch)
+        # valid 하지 않은 줄
+        read_counts.pop(None, None)
+
+        for line, cnt in read_counts.items():
+            line = line.decode('ascii')
+            if is_mutated(wild_seq, line, target_end_pos, backward_target_length):
+                # 변형으로 쳐서 read 갯수만큼 카운트하고, 결과 출력을 위해 동일 시퀀스 갯수와 함께 저장한다.
+                result['mutated_cnt'] += cnt
+                result['mutated_dict'][line] = cnt
+
+        # 변형 퍼센티지 계산
+        try:
+            result['mutated_rates'] = float(result['mutated_cnt']) / result['total_cnt'] * 100
+        except ZeroDivisionError:
+            result['mutated_rates'] = 0
+
+        # 각 결과값 저장.
+        with open(os.path.join(result_folder_name, file_name), 'w') as f:
+            f.write('{}\n'.format(wild_seq))
+            f.write('--------\n')
+            for mutated_seq, cnt in result['mutated_dict'].items():
+                f.write('{} X {}\n'.format(mutated_seq, cnt))
+            f.write('--------\n')
+            f.write('mutation rates : {} %'.format(result['mutated_rates']))
+
+    except Exception as e:
+        print(e)
+        print('{} not found.'.format(file_name))
+        return None
+
+    # 변형 시퀀스는 파일로 썼으므로 요약만 돌려준다.
+    result.pop('mutated_dict')
+    if checkpoint_folder:
+        save_target(checkpoint_folder, file_name_no_ext, result, sample_path)
+    return result
+
+
+def append_result_info(f, name, data):
+    # 최종 결과물 파일에 끝난 타겟 한 줄을 덧붙인다. 중간에 멈춰도 끝난 타겟까지는 남도록 바로 flush 한다.
+    f.write('{} : {} : {}/{}\n'.format(name, data['mutated_rates'], data['mutated_cnt'], data['total_cnt']))
+    f.flush()
+
+
+def do(input_file_name, backward_target_length, dest_folder_path, workers=1):
+    # 타겟마다 analyse_target 을 workers 개의 프로세스로 나눠 돌린다.
+    # 결과는 인풋 파일 순서대로 모으기 때문에 result_info.txt 의 순서는 워커 수와 상관없이 같다.
+    cur_cnt = 0
+    final_results = {}
+
+    with open(input_file_name, 'r') as f:
+        target_lines = f.readlines()
+    target_cnt = len(target_lines)
+    target_sets = [target_set for target_set in map(parse_target_set, target_lines) if target_set]
+    if not target_sets:
+        return final_results
+
+    # 결과 저장용 폴더 생성
+    result_folder_name = os.path.join(BASE_DIR, 'analyse_results')
+    if not os.path.exists(result_folder_name):
+        os.makedirs(result_folder_name)
+
+    # 같은 조건으로 다시 돌리면 체크포인트에 남은 타겟은 건너뛴다.
+    checkpoint_folder = os.path.join(result_folder_name, CHECKPOINT_FOLDER_NAME)
+    # 인풋 파일이 바뀌었거나 샘플 파일이 바뀐 타겟은 다시 분석한다.
+    done_results = load_checkpoint(checkpoint_folder, {
+        'input_file': os.path.abspath(input_file_name),
+        'input_fingerprint': file_fingerprint(input_file_name),
+        'backward_target_length': int(backward_target_length),
+        'dest_folder': os.path.abspath(dest_folder_path),
+    }, {name: os.path.join(dest_folder_path, '{}.txt'.format(name)) for name, _, _ in target_sets})
+    if done_results:
+        print('{} targets restored from checkpoint'.format(len(done_results)))
+
+    task = partial(analyse_target, backward_target_length=int(backward_target_length),
+                   dest_folder_path=dest_folder_path, result_folder_name=result_folder_name,
+                   checkpoint_folder=checkpoint_folder)
+    pending = [target_set for target_set in target_sets if target_set[0] not in done_results]
+    names, wild_seqs, targets = zip(*pending) if pending else ((), (), ())
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        with open(os.path.join(result_folder_name, 'result_info.txt'), 'w') as info_f:
+            results = executor.map(task, names, wild_seqs, targets) if executor else map(task, names, wild_seqs,
+                                                                                          targets)
+            for name, _, _ in target_sets:
+                result = done_results[name] if name in done_results else next(results)
+                if result is not None:
+                    # 문제 없다면 결과물을 모은다.
+                    final_results[name] = result
+                    append_result_info(info_f, name, result)
+
+                # 타겟 하나 분석 종료 카운트+1
+                cur_cnt += 1
+                # 진행율 화면 표시
+                progress_percentage = float(cur_cnt) / target_cnt * 100
+                print('{} % done'.format(progress_percentage))
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # 끝까지 돌았으면 체크포인트는 필요 없다.
+    clear_checkpoint(checkpoint_folder)
+    return final_results
+
+
+if __name__ == '__main__':
+    print('Input file name with extension: ')
+    # 이름 : 와일드시퀀스 : 타겟 으로 구성된 파일을 입력받는다.
+    input_file_name = input()
+    input_file_name = os.path.join(BASE_DIR, input_file_name)
+
+    if not os.path.isfile(input_file_name):
+        print('File Not Found. Check it is in same folder')
+        sys.exit(1)
+
+    print('Input length to check mutation from backward of target: ')
+    # 사용자 지정 위치를 입력받는다. 타겟의 제일 위에서부터 ~번째이다.
+    backward_target_length = input()
+
+    print('Input result folder name: ')
+    # 추출기가 뽑아낸 대상시퀀스들이 모여있는 폴더 이름 입력.
+    dest_folder_name = input()
+    dest_folder_name = os.path.join(BASE_DIR, dest_folder_name)
+
+    if not os.path.isdir(dest_folder_name):
+        print('Folder Not Found')
+        sys.exit(1)
+
+    print('Input number of processes (default {}): '.format(os.cpu_count()))
+    # 타겟을 나눠서 돌릴 프로세스 갯수. 입력이 없으면 CPU 갯수만큼 쓴다.
+    workers = input().strip()
+    workers = int(workers) if workers else os.cpu_count()
+
+    # 분석시작
+    do(input_file_name, backward_target_length, dest_folder_name, workers)
+
+    print('Well done. Press any key')
+    input()
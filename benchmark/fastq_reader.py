@@ -0,0 +1,76 @@
+import os
+import random
+import tempfile
+import time
+
+import click
+
+from Bio import SeqIO
+
+from src.reader import read_fastq_batches
+from toolchain import is_valid_seq_line
+
+
+def read_with_seqio(path):
+    # read_from_fastq_file 의 기존 구현
+    with open(path, 'r') as handle:
+        for line in SeqIO.parse(handle, 'fastq'):
+            if not is_valid_seq_line(str(line.seq)):
+                continue
+
+            yield {
+                'seq': str(line.seq).upper()
+            }
+
+
+def read_with_reader(path):
+    for batch in read_fastq_batches(path):
+        for seqs in batch:
+            yield {
+                'seq': seqs
+            }
+
+
+def write_random_fastq(path, reads, length, seed=0):
+    rand = random.Random(seed)
+    quality = 'I' * length
+    with open(path, 'w') as f:
+        for idx in range(reads):
+            seqs = ''.join(rand.choice('ACGTacgtN' if idx % 50 == 0 else 'ACGT') for _ in range(length))
+            f.write('@read{}\n{}\n+\n{}\n'.format(idx, seqs, quality))
+
+
+def measure(func, path):
+    start = time.perf_counter()
+    seqs = [row['seq'] for row in func(path)]
+    return seqs, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--file', 'path', default=None, type=str, help='측정할 fastq 파일입니다. 없으면 임의로 만듭니다.')
+@click.option('--reads', default=200000, type=int, help='임의로 만들 read 갯수입니다.')
+@click.option('--length', default=150, type=int, help='임의로 만들 read 길이입니다.')
+def main(path, reads, length):
+    generated = path is None
+    if generated:
+        path = tempfile.NamedTemporaryFile(suffix='.fastq', delete=False).name
+        write_random_fastq(path, reads, length)
+
+    try:
+        old_seqs, old_time = measure(read_with_seqio, path)
+        new_seqs, new_time = measure(read_with_reader, path)
+    finally:
+        if generated:
+            os.remove(path)
+
+    if old_seqs != new_seqs:
+        raise click.ClickException('두 리더의 결과가 다릅니다.')
+
+    click.echo('reads        : {}'.format(len(new_seqs)))
+    click.echo('SeqIO        : {:.2f} s, {:.0f} reads/s'.format(old_time, len(old_seqs) / old_time))
+    click.echo('reader       : {:.2f} s, {:.0f} reads/s'.format(new_time, len(new_seqs) / new_time))
+    click.echo('speed up     : {:.1f}x'.format(old_time / new_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from queue import Empty
+
+import click
+
+from benchmark.synthetic import generate_dataset
+
+STAGES = ('ingest', 'extract', 'export', 'demux', 'analyser', 'frequency')
+
+# 측정 시간에 import 가 들어가지 않도록 단계를 시작하기 전에 미리 불러온다.
+STAGE_MODULES = {
+    'ingest': 'toolchain',
+    'extract': 'toolchain',
+    'export': 'toolchain',
+    'demux': 'toolchain',
+    'analyser': 'analyser_v4_src_run',
+    'frequency': 'src.analyser.frequency',
+}
+
+BACKWARD_TARGET_LENGTH = 10
+INDEL_START = 25
+INDEL_LENGTH = 10
+
+# 단계 프로세스가 살아 있는지 확인하는 간격(초)
+STAGE_POLL_SECONDS = 1
+
+
+def _count_lines(path):
+    with open(path, 'rb') as f:
+        return sum(1 for _ in f)
+
+
+def stage_ingest(workdir, state):
+    import toolchain
+
+    db_name = state['db_name']
+    coll_info = toolchain.create_joined_coll(toolchain.init(db_name), toolchain.KMER_SIZE, toolchain.KMER_WINDOW,
+                                             False)
+    report = toolchain.insert_files(db_name, [os.path.join(workdir, 'reads.fastq')], coll_info, 10000, 1,
+                                    toolchain.INSERT_WORKER_SIZE, toolchain.INSERT_QUEUE_SIZE, 0, lambda _: None)
+    return report['docs'], {'joined': coll_info['_id']}
+
+
+def stage_extract(workdir, state):
+    import toolchain
+
+    barcode_maps = toolchain.parse_barcode_file(os.path.join(workdir, 'barcodes.txt'))
+    extracted = toolchain.extract_barcodes(state['db_name'], state['joined'], barcode_maps, lambda _: None)
+    result_info = toolchain.connect_to_mongodb()[state['db_name']][extracted].find_one({'_id': 'result_info'})
+    result_info.pop('_id')
+    return sum(result_info.values()), {'extracted': extracted}
+
+
+def stage_export(workdir, state):
+    import toolchain
+
+    coll = toolchain.connect_to_mongodb()[state['db_name']][state['extracted']]
+    result_info = coll.find_one({'_id': 'result_info'})
+    result_info.pop('_id')
+    folder = os.path.join(workdir, 'export')
+    os.makedirs(folder, exist_ok=True)
+    toolchain.write_result_info(folder, result_info)
+    toolchain.export_extracted(coll, folder, list(result_info), True, toolchain.EXPORT_BATCH_SIZE,
+                               toolchain.EXPORT_WORKER_SIZE, False, lambda _: None)
+    return sum(result_info.values()), {}
+
+
+def stage_demux(workdir, state):
+    import toolchain
+
+    barcode_maps = toolchain.parse_barcode_file(os.path.join(workdir, 'barcodes.txt'))
+    folder = os.path.join(workdir, 'demux')
+    os.makedirs(folder, exist_ok=True)
+    toolchain.demux_files([os.path.join(workdir, 'reads.fastq')], barcode_maps, folder, toolchain.DEMUX_BUFFER_SIZE)
+    return _count_lines(os.path.join(workdir, 'reads.fastq')) // 4, {}
+
+
+def stage_analyser(workdir, state):
+    import analyser_v4_src_run
+
+    # 결과는 BASE_DIR/analyse_results 에 쓰이므로 작업 폴더로 돌려놓는다.
+    analyser_v4_src_run.BASE_DIR = workdir
+    sample_folder = os.path.join(workdir, 'samples')
+    analyser_v4_src_run.do(os.path.join(workdir, 'targets.txt'), BACKWARD_TARGET_LENGTH, sample_folder)
+    return sum(_count_lines(os.path.join(sample_folder, file)) for file in os.listdir(sample_folder)), {}
+
+
+def stage_frequency(workdir, state):
+    from src.analyser.frequency import run
+
+    folder = os.path.join(workdir, 'frequency')
+    os.makedirs(folder, exist_ok=True)
+    summaries = run(os.path.join(workdir, 'ref.txt'), os.path.join(workdir, 'samples'), folder, INDEL_START,
+                    INDEL_LENGTH)
+    return sum(int(summary['total']) for summary in summaries.values()), {}
+
+
+def _run_in_child(queue, name, workdir, state):
+    try:
+        importlib.import_module(STAGE_MODULES[name])
+        start = time.perf_counter()
+        reads, state_update = globals()['stage_' + name](workdir, state)
+    except Exception as e:
+        queue.put({'error': '{}: {}'.format(type(e).__name__, e)})
+        return
+
+    elapsed = time.perf_counter() - start
+    queue.put({
+        'reads': reads,
+        'seconds': elapsed,
+        'reads_per_sec': reads / elapsed if elapsed else 0,
+        # 리눅스는 KB, macOS 는 byte 단위이다.
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'state': state_update,
+    })
+
+
+def run_stage(name, workdir, state):
+    # 단계마다 새 프로세스에서 돌려서 peak RSS 가 앞 단계의 영향을 받지 않게 한다.
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_in_child, args=(queue, name, workdir, state))
+    process.start()
+    # 결과를 남기지 못하고 죽으면 (OOM kill, SystemExit 등) 영원히 기다리지 않도록 살아 있는지 보면서 기다린다.
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=STAGE_POLL_SECONDS)
+        except Empty:
+            if process.is_alive():
+                continue
+            # 끝나기 직전에 넣은 결과가 아직 건너오는 중일 수 있으므로 한 번 더 본다.
+            try:
+                result = queue.get(timeout=STAGE_POLL_SECONDS)
+            except Empty:
+                result = {'error': '결과 없이 종료되었습니다. (exitcode {})'.format(process.exitcode)}
+    process.join()
+    state.update(result.pop('state', {}))
+    return result
+
+
+def get_version():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.realpath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def drop_db(db_name):
+    import toolchain
+
+    try:
+        toolchain.connect_to_mongodb().drop_database(db_name)
+    except toolchain.DBConnectionFailed:
+        pass
+
+
+@click.group()
+def benchmark():
+    pass
+
+
+@benchmark.command()
+@click.option('--reads', default=100000, type=int, help='만들 read 갯수입니다.')
+@click.option('--length', default=150, type=int, help='read 길이입니다.')
+@click.option('--barcodes', default=20, type=int, help='바코드 갯수입니다.')
+@click.option('--mutation-rate', default=0.1, type=float, help='1MM 변이를 심을 비율입니다.')
+@click.option('--indel-rate', default=0.05, type=float, help='DNA/RNA bulge 를 심을 비율입니다.')
+@click.option('--seed', default=0, type=int)
+@click.option('--stage', 'stages', multiple=True, type=click.Choice(STAGES), help='돌릴 단계입니다. 없으면 전부 돌립니다.')
+@click.option('--workdir', default=None, type=str, help='데이터를 만들 폴더입니다. 없으면 임시 폴더를 씁니다.')
+@click.option('--output', default=None, type=str, help='결과를 저장할 json 파일입니다.')
+@click.option('--keep-db', is_flag=True, help='측정이 끝나도 벤치마크용 db 를 지우지 않습니다.')
+def run(reads, length, barcodes, mutation_rate, indel_rate, seed, stages, workdir, output, keep_db):
+    params = {
+        'reads': reads,
+        'length': length,
+        'barcodes': barcodes,
+        'mutation_rate': mutation_rate,
+        'indel_rate': indel_rate,
+        'seed': seed,
+    }
+    workdir = workdir or tempfile.mkdtemp(prefix='seq_toolchain_bench_')
+    click.echo('데이터 생성: {}'.format(workdir))
+    generate_dataset(workdir, reads, length, barcodes, mutation_rate, indel_rate, seed)
+
+    state = {'db_name': 'bench-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'))}
+    results = {}
+    for name in stages or STAGES:
+        if name == 'extract' and 'joined' not in state or name == 'export' and 'extracted' not in state:
+            results[name] = {'error': 'skipped: 앞 단계가 실행되지 않았습니다.'}
+        else:
+            results[name] = run_stage(name, workdir, state)
+
+        if 'error' in results[name]:
+            click.echo('{:<10} {}'.format(name, results[name]['error']))
+        else:
+            click.echo('{:<10} {:>10} reads {:>8.2f} s {:>12.0f} reads/s  peak rss {}'.format(
+                name, results[name]['reads'], results[name]['seconds'], results[name]['reads_per_sec'],
+                results[name]['peak_rss']))
+
+    if not keep_db and 'joined' in state:
+        drop_db(state['db_name'])
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({
+                'version': get_version(),
+                'created': datetime.now().isoformat(),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'params': params,
+                'stages': results,
+            }, f, indent=2)
+
+
+@benchmark.command()
+@click.argument('base', type=click.File('r'))
+@click.argument('target', type=click.File('r'))
+def compare(base, target):
+    base, target = json.load(base), json.load(target)
+    click.echo('base   : {}'.format(base['version']))
+    click.echo('target : {}'.format(target['version']))
+    if base['params'] != target['params']:
+        click.echo('두 결과의 측정 조건이 다릅니다.')
+
+    for name in STAGES:
+        before, after = base['stages'].get(name, {}), target['stages'].get(name, {})
+        if 'reads_per_sec' not in before or 'reads_per_sec' not in after:
+            continue
+        click.echo('{:<10} {:>12.0f} -> {:>12.0f} reads/s ({:.2f}x)  peak rss {} -> {}'.format(
+            name, before['reads_per_sec'], after['reads_per_sec'],
+            after['reads_per_sec'] / before['reads_per_sec'] if before['reads_per_sec'] else 0,
+            before['peak_rss'], after['peak_rss']))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,93 @@
+import os
+import random
+from itertools import chain
+
+import click
+
+from src.mismatch.generator import add_one_bulge, generate_one_mismatch, remove_one_bulge
+
+FLANK_LENGTH = 10
+BARCODE_LENGTH = 20
+TARGET_LENGTH = 20
+
+
+def _random_seqs(rand, length):
+    return ''.join(rand.choice('ACGT') for _ in range(length))
+
+
+def make_barcodes(rand, count):
+    barcodes = set()
+    while len(barcodes) < count:
+        barcodes.add(_random_seqs(rand, BARCODE_LENGTH))
+    return {'bc{}'.format(idx + 1): barcode for idx, barcode in enumerate(sorted(barcodes))}
+
+
+def generate_dataset(folder, reads, length, barcode_count, mutation_rate, indel_rate, seed=0):
+    # 읽기 구조: 왼쪽 flank + 바코드 + 바코드별 와일드 영역(변이 심음) + 오른쪽 flank
+    # 변이는 src/mismatch/generator.py 의 1MM, DNA/RNA bulge 생성기에서 하나를 골라 심는다.
+    region_length = length - BARCODE_LENGTH - 2 * FLANK_LENGTH
+    if region_length < TARGET_LENGTH:
+        raise click.BadParameter('read 길이는 {} 이상이어야 합니다.'.format(
+            TARGET_LENGTH + BARCODE_LENGTH + 2 * FLANK_LENGTH))
+
+    rand = random.Random(seed)
+    left, right = _random_seqs(rand, FLANK_LENGTH), _random_seqs(rand, FLANK_LENGTH)
+    barcode_maps = make_barcodes(rand, barcode_count)
+    wilds = {key: _random_seqs(rand, region_length) for key in barcode_maps}
+    mismatches = {key: [seqs for _, seqs in generate_one_mismatch(wild)] for key, wild in wilds.items()}
+    bulges = {key: [seqs for _, seqs in chain(add_one_bulge(wild), remove_one_bulge(wild))]
+              for key, wild in wilds.items()}
+
+    sample_folder = os.path.join(folder, 'samples')
+    os.makedirs(sample_folder, exist_ok=True)
+    samples = {key: [] for key in barcode_maps}
+    keys = list(barcode_maps)
+    with open(os.path.join(folder, 'reads.fastq'), 'w') as f:
+        for idx in range(reads):
+            key = rand.choice(keys)
+            region = wilds[key]
+            dice = rand.random()
+            if dice < mutation_rate:
+                region = rand.choice(mismatches[key])
+            elif dice < mutation_rate + indel_rate:
+                region = rand.choice(bulges[key])
+
+            seqs = left + barcode_maps[key] + region + right
+            samples[key].append(seqs + '\n')
+            f.write('@read{}\n{}\n+\n{}\n'.format(idx, seqs, 'I' * len(seqs)))
+
+    for key, lines in samples.items():
+        with open(os.path.join(sample_folder, key + '.txt'), 'w') as f:
+            f.writelines(sorted(lines))
+
+    with open(os.path.join(folder, 'barcodes.txt'), 'w') as f:
+        f.writelines('{}:{}\n'.format(key, barcode) for key, barcode in barcode_maps.items())
+
+    # analyser_v4_src_run 입력: 이름 : 와일드시퀀스 : 타겟
+    with open(os.path.join(folder, 'targets.txt'), 'w') as f:
+        for key, barcode in barcode_maps.items():
+            wild = left + barcode + wilds[key] + right
+            f.write('{} : {} : {}\n'.format(key, wild, wilds[key][:TARGET_LENGTH]))
+
+    # frequency.py 입력: 파일이름:바코드:바코드+와일드
+    with open(os.path.join(folder, 'ref.txt'), 'w') as f:
+        for key, barcode in barcode_maps.items():
+            f.write('{}:{}:{}\n'.format(key, barcode, barcode + wilds[key]))
+
+    return barcode_maps
+
+
+@click.command()
+@click.argument('folder')
+@click.option('--reads', default=100000, type=int, help='만들 read 갯수입니다.')
+@click.option('--length', default=150, type=int, help='read 길이입니다.')
+@click.option('--barcodes', default=20, type=int, help='바코드 갯수입니다.')
+@click.option('--mutation-rate', default=0.1, type=float, help='1MM 변이를 심을 비율입니다.')
+@click.option('--indel-rate', default=0.05, type=float, help='DNA/RNA bulge 를 심을 비율입니다.')
+@click.option('--seed', default=0, type=int)
+def main(folder, reads, length, barcodes, mutation_rate, indel_rate, seed):
+    generate_dataset(folder, reads, length, barcodes, mutation_rate, indel_rate, seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import numpy as np
+
+# EMBOSS water 의 DNA 기본값(EDNAFULL, gap open 10, gap extend 0.5)과 같은 점수 체계.
+MATCH_SCORE = 5
+MISMATCH_SCORE = -4
+GAP_OPEN = -10
+GAP_EXTEND = -0.5
+
+# 기본 점수 체계에서 mismatch 하나는 일치보다 9 손해이고 gap 은 열기만 해도 10 손해이다.
+# 그래서 mismatch 가 1개 이하인 gap 없는 정렬은 어떤 gap 정렬보다도 점수가 높다.
+GAPLESS_MISMATCHES = 1
+
+# 행렬 안에서 갈 수 없는 칸
+NEG_INF = -np.inf
+
+# traceback 상태. H: 대각선(일치/불일치), F: ref 쪽 문자에 '-' 대응, E: sort 쪽 문자에 '-' 대응
+_H, _E, _F = 0, 1, 2
+
+
+def _encode(seqs):
+    return np.frombuffer(seqs.encode('ascii'), dtype=np.uint8)
+
+
+def _fill(ref, sort, match, mismatch, gap_open, gap_extend):
+    # Gotoh 지역 정렬 행렬을 ref 한 줄씩 채운다. 한 줄 안은 numpy 로 sort 전체를 한 번에 계산한다.
+    # 같은 줄의 가로 gap(E)은 왼쪽 칸에 의존하지만, gap 바로 뒤에 gap 을 새로 여는 것은 늘이는 것보다 항상 손해이므로
+    # E[j] = open + (j-1)*extend + max_{k<j}(Hp[k] - k*extend) 로 바꿔서 누적 최댓값 한 번으로 구한다.
+    # (Hp 는 E 를 빼고 구한 H)
+    n, m = len(ref), len(sort)
+    columns = np.arange(m + 1)
+    column_extend = columns * gap_extend
+    gap_base = gap_open + (columns[1:] - 1) * gap_extend
+    scores = np.where(_encode(ref)[:, None] == _encode(sort), float(match), float(mismatch))
+
+    h = np.zeros((n + 1, m + 1))
+    e = np.full((n + 1, m + 1), NEG_INF)
+    f = np.full((n + 1, m + 1), NEG_INF)
+    hp = np.zeros(m + 1)
+    for i in range(1, n + 1):
+        np.maximum(h[i - 1] + gap_open, f[i - 1] + gap_extend, out=f[i])
+        np.maximum(f[i], 0, out=hp)
+        np.maximum(hp[1:], h[i - 1, :-1] + scores[i - 1], out=hp[1:])
+        np.add(gap_base, np.maximum.accumulate(hp - column_extend)[:-1], out=e[i, 1:])
+        np.maximum(hp, e[i], out=h[i])
+    return h, e, f
+
+
+def _traceback(ref, sort, h, e, f, end, match, mismatch, gap_extend):
+    i, j = end
+    state = _H
+    aligned_ref, aligned_sort = [], []
+    while True:
+        if state == _H:
+            if h[i, j] <= 0:
+                break
+            score = match if ref[i - 1] == sort[j - 1] else mismatch
+            if h[i, j] == h[i - 1, j - 1] + score:
+                aligned_ref.append(ref[i - 1])
+                aligned_sort.append(sort[j - 1])
+                i, j = i - 1, j - 1
+            elif h[i, j] == f[i, j]:
+                state = _F
+            else:
+                state = _E
+        elif state == _F:
+            aligned_ref.append(ref[i - 1])
+            aligned_sort.append('-')
+            state = _F if f[i, j] == f[i - 1, j] + gap_extend else _H
+            i -= 1
+        else:
+            aligned_ref.append('-')
+            aligned_sort.append(sort[j - 1])
+            state = _E if e[i, j] == e[i, j - 1] + gap_extend else _H
+            j -= 1
+
+    return ''.join(reversed(aligned_ref)), ''.join(reversed(aligned_sort)), (i, j)
+
+
+def local_align(ref, sort, match=MATCH_SCORE, mismatch=MISMATCH_SCORE, gap_open=GAP_OPEN, gap_extend=GAP_EXTEND):
+    # 가장 점수가 높은 지역 정렬 하나만 구해서 pairwise2 와 같은 모양의 (ref, sort) 로 돌려준다.
+    # 정렬된 구간의 앞쪽은 오른쪽 정렬, 뒤쪽은 왼쪽 정렬해서 '-' 로 길이를 맞춘다.
+    # 점수가 같은 끝점이 여럿이면 ref, sort 순으로 앞에 있는 것을 쓴다.
+    h, e, f = _fill(ref, sort, match, mismatch, gap_open, gap_extend)
+    end = np.unravel_index(np.argmax(h), h.shape)
+    if h[end] <= 0:
+        return ref, sort
+
+    aligned_ref, aligned_sort, start = _traceback(ref, sort, h, e, f, end, match, mismatch, gap_extend)
+    prefix_len = max(start)
+    suffix_len = max(len(ref) - end[0], len(sort) - end[1])
+    return (ref[:start[0]].rjust(prefix_len, '-') + aligned_ref + ref[end[0]:].ljust(suffix_len, '-'),
+            sort[:start[1]].rjust(prefix_len, '-') + aligned_sort + sort[end[1]:].ljust(suffix_len, '-'))
+
+
+def _find_all(string, sub):
+    pos = string.find(sub)
+    while pos != -1:
+        yield pos
+        pos = string.find(sub, pos + 1)
+
+
+def is_gapless_match(ref, sort):
+    # 기본 점수 체계의 local_align 결과가 gap 없는 대각선 정렬이라서 (ref 앞뒤 '-' 패딩, sort 그대로) 가 되는지 본다.
+    # 참이면 정렬을 하지 않아도 sort 쪽 결과는 sort 자신이고 ref 쪽에는 안쪽 gap 이 없다.
+    # ref 가 그대로 들어있으면 점수가 최대이므로 항상 참이다.
+    if ref in sort:
+        return True
+
+    # mismatch 1개짜리 정렬과 점수가 같거나 높은 다른 정렬은 ref 를 mismatch 1개 이하로 전부 덮거나
+    # ref 의 한쪽 끝만 빼고 그대로 덮어야 하는데, 어느 쪽이든 ref 의 앞쪽 절반이나 뒤쪽 절반은 그대로 들어있다.
+    # 그래서 절반이 나오는 위치로 후보를 모아서 후보가 하나뿐이고 mismatch 가 GAPLESS_MISMATCHES 이하일 때만 참이다.
+    half = len(ref) // 2
+    if not half:
+        return False
+
+    offsets = set(_find_all(sort, ref[:half]))
+    offsets.update(pos - half for pos in _find_all(sort, ref[half:]))
+    if len(offsets) != 1:
+        return False
+
+    offset = offsets.pop()
+    if offset < 0 or offset + len(ref) > len(sort):
+        return False
+    return sum(a != b for a, b in zip(ref, sort[offset:offset + len(ref)])) <= GAPLESS_MISMATCHES
@@ -2,4 +2,4 @@
 python3 -m venv ~/.virtualenv/frequency
 source ~/.virtualenv/frequency/bin/activate
 sudo pip install -U pip
-pip install biopython
+pip install numpy biopython
\ No newline at end of file
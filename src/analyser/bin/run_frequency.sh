@@ -1,4 +1,4 @@
 #!/bin/bash
 source ~/.virtualenv/frequency/bin/activate
-python ../frequency.py
+PYTHONPATH=../../..:$PYTHONPATH python ../frequency.py
 deactivate
\ No newline at end of file
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+
+CHECKPOINT_FOLDER_NAME = '.checkpoint'
+MANIFEST_NAME = 'manifest.json'
+TARGET_FOLDER_NAME = 'targets'
+
+
+def _write_json(path, data):
+    # 쓰는 도중에 죽어도 깨진 파일이 남지 않도록 임시 파일에 쓰고 바꿔치기한다.
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def file_fingerprint(path):
+    # 파일이 바뀌었는지 알아보기 위한 [크기, 수정 시각(ns)]. 파일이 없으면 None.
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def clear_checkpoint(folder):
+    shutil.rmtree(folder, ignore_errors=True)
+
+
+def load_checkpoint(folder, params, source_paths=None):
+    # 같은 입력 조건(params)으로 다시 돌린 경우 이미 끝난 타겟의 결과를 {이름: 결과} 로 돌려준다.
+    # 조건이 다르거나 체크포인트가 없으면 새로 만들고 빈 dict 를 돌려준다.
+    # source_paths({이름: 샘플 파일}) 가 있으면 저장할 때와 샘플 파일이 달라진 타겟은 버린다.
+    manifest_path = os.path.join(folder, MANIFEST_NAME)
+    target_folder = os.path.join(folder, TARGET_FOLDER_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        if manifest == params:
+            results = {}
+            for file in os.listdir(target_folder):
+                if not file.endswith('.json'):
+                    continue
+                with open(os.path.join(target_folder, file), 'r') as f:
+                    data = json.load(f)
+                if source_paths is not None and (
+                        data['name'] not in source_paths or
+                        data.get('source') != file_fingerprint(source_paths[data['name']])):
+                    continue
+                results[data['name']] = data['result']
+            return results
+
+    clear_checkpoint(folder)
+    os.makedirs(target_folder)
+    _write_json(manifest_path, params)
+    return {}
+
+
+def save_target(folder, name, result, source_path=None):
+    # 타겟 하나가 끝날 때마다 결과를 남긴다. 여러 프로세스에서 불러도 타겟마다 파일이 따로라서 안전하다.
+    # source_path 가 있으면 그 샘플 파일의 fingerprint 도 같이 남긴다.
+    data = {'name': name, 'result': result}
+    if source_path:
+        data['source'] = file_fingerprint(source_path)
+    _write_json(os.path.join(folder, TARGET_FOLDER_NAME, '{}.json'.format(name)), data)
@@ -1,14 +1,28 @@
 import os
 import re
-from collections import namedtuple, defaultdict
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
-from Bio.pairwise2 import align
-from Bio.SubsMat.MatrixInfo import blosum62
+import numpy as np
 
+from src.analyser.aligner import is_gapless_match, local_align
+from src.analyser.checkpoint import CHECKPOINT_FOLDER_NAME, clear_checkpoint, file_fingerprint, load_checkpoint, \
+    save_target
+from src.reader import read_sample_lines
 
-ref_datum = namedtuple('RefData', ['file', 'barcode', 'full', 'position'])
-ref_data = []
+
+RefData = namedtuple('RefData', ['file', 'barcode', 'full', 'position'])
+
+REMOVED = 'removed'
+INDEL = 'indel'
+NORMAL = 'normal'
+
+BASES = 'ACGT'
+# A, C, G, T 는 0~3, 나머지와 길이를 맞추는 padding 은 4
+BASE_TABLE = bytes(BASES.find(chr(code)) % (len(BASES) + 1) for code in range(256))
+COUNT_BLOCK_SIZE = 100000
 
 
 def clean_seqs(string):
@@ -55,11 +69,175 @@ def check_indel(sort_seqs, datum):
     return True if count >= 2 else False
 
 
-def get_padding_seqs(ref, sort, index=0):
+def get_padding_seqs(ref, sort, index=0, compat=False):
+    # 기본은 DNA 점수 체계의 numpy 지역 정렬. compat 이면 검증용으로 예전과 같은 pairwise2 + blosum62 결과를 쓴다.
+    if not compat:
+        return local_align(ref, sort)
+
+    from Bio.pairwise2 import align
+    from Bio.SubsMat.MatrixInfo import blosum62
+
     pref, psort, _, _, _ = align.localds(ref, sort, blosum62, -10, -1)[index]
     return pref, psort
 
 
+def make_ref_datum(line, indel_start, indel_len):
+    sorting_file, barcode, full = line.split(':')
+    sorting_file += '.txt'
+    barcode, full = clean_seqs(barcode).upper(), clean_seqs(full).upper()
+    start = len(full) - indel_start
+    end = start + indel_len
+    return RefData(sorting_file, barcode, full, (start, end))
+
+
+def classify_seqs(seqs, datum, compat=False):
+    # gap 없이 맞는 read 는 정렬해도 padding 이 없어서 insertion, deletion 은 아니고 indel 검사만 하면 된다.
+    if not compat and is_gapless_match(datum.full, seqs):
+        return INDEL if check_indel(seqs, datum) else NORMAL
+
+    pref, psort = get_padding_seqs(datum.full, seqs, compat=compat)
+    # pref, psort, _, _, _ = align.localms(datum.full, seqs, 5, -4, -2, -0.5)[0]
+    if (check_insertion(pref, datum.position)
+            or check_deletion(psort, datum.position, datum.barcode)):
+        return REMOVED
+    elif check_indel(psort, datum):
+        return INDEL
+    return NORMAL
+
+
+def add_base_counts(counts, seqs_list):
+    # seqs_list 를 위치별 A/C/G/T 갯수로 세서 counts((4, 위치) 행렬)에 더한다. 더 긴 read 가 오면 열을 늘린다.
+    # 한 block 을 (read, 위치) uint8 행렬로 만들고 (코드, 위치) 쌍을 bincount 한 번으로 센다.
+    width = max(map(len, seqs_list), default=0)
+    if not width:
+        return counts
+
+    codes = np.frombuffer(''.join(seqs.ljust(width, '-') for seqs in seqs_list).encode('ascii').translate(BASE_TABLE),
+                          dtype=np.uint8).reshape(-1, width)
+    block = np.bincount((codes.astype(np.intp) * width + np.arange(width)).ravel(),
+                        minlength=(len(BASES) + 1) * width).reshape(-1, width)[:len(BASES)]
+    if counts.shape[1] < width:
+        counts = np.pad(counts, ((0, 0), (0, width - counts.shape[1])))
+    counts[:, :width] += block
+    return counts
+
+
+def write_count(path, ref, count):
+    with open(path, 'w') as f:
+        buffer = []
+        buffer.append('-,' + ','.join(ref))
+        for base, base_counts in zip(BASES, count):
+            buffer.append(base + ',' + ','.join(map(str, base_counts)))
+        buffer = [line + '\n' for line in buffer]
+
+        f.writelines(buffer)
+
+
+def write_info(path, summary):
+    with open(path, 'w') as f:
+        f.writelines([
+            'indel count: ' + summary['indels'] + '\n',
+            'remove count: ' + summary['removed'] + '\n',
+            'normal count: ' + summary['normals'] + '\n',
+            'total count: ' + summary['total'] + '\n',
+        ])
+
+
+def analyse_reference(datum, sort_base_folder, result_folder, indel_folder, compat=False, checkpoint_folder=None):
+    # reference 하나의 sort 파일을 한 줄씩 분류하고 결과 파일을 바로 쓴다. indel read 는 읽는 대로 파일에 쓴다.
+    # 워커 프로세스에서 돌기 때문에 갯수 요약만 돌려준다. 파일이 없으면 None.
+    name = datum.file.split('.')[0]
+    normals = []
+    count = np.zeros((len(BASES), 0), dtype=np.int64)
+    summary = {INDEL: 0, REMOVED: 0, NORMAL: 0}
+    total = 0
+
+    sort_file = os.path.join(sort_base_folder, datum.file)
+    if not os.path.exists(sort_file):
+        print(datum.file + ' < 이런 이름의 파일 없음')
+        return None
+
+    with open(os.path.join(indel_folder, name + '.txt'), 'w') as indel_f:
+        # 줄 앞에서부터 이어지는 A, C, G, T 만 쓴다. (clean_seqs 와 같다) 시퀀스가 없는 줄은 건너뛴다.
+        for seqs in read_sample_lines(sort_file, prefix=True):
+            if not seqs:
+                continue
+
+            seqs = seqs.decode('ascii')
+            total += 1
+            classified = classify_seqs(seqs, datum, compat)
+            summary[classified] += 1
+            if classified == INDEL:
+                indel_f.write(seqs + '\n')
+            elif classified == NORMAL:
+                start = seqs.find(datum.barcode)
+                end = start + (len(datum.full) - len(datum.barcode))
+                normals.append(seqs[start:end])
+                # normal read 는 위치별 갯수만 필요하므로 block 단위로 세고 버린다.
+                if len(normals) >= COUNT_BLOCK_SIZE:
+                    count = add_base_counts(count, normals)
+                    normals = []
+
+    count = add_base_counts(count, normals)
+    write_count(os.path.join(result_folder, name + '_count.txt'),
+                datum.full[datum.full.find(datum.barcode) + len(datum.barcode):], count.tolist())
+
+    summary = {
+        'indels': str(summary[INDEL]),
+        'removed': str(summary[REMOVED]),
+        'normals': str(summary[NORMAL]),
+        'total': str(total),
+    }
+    write_info(os.path.join(result_folder, name + '_info.txt'), summary)
+
+    if checkpoint_folder:
+        save_target(checkpoint_folder, datum.file, summary, sort_file)
+    return summary
+
+
+def run(ref_file, sort_base_folder, result_base_folder, indel_start, indel_len, workers=1, compat=False):
+    # reference 별로 analyse_reference 를 workers 개의 프로세스로 나눠 돌리고 {sort 파일: 갯수 요약} 을 돌려준다.
+    # 결과 파일은 reference 하나가 끝날 때마다 쓰인다.
+    with open(ref_file, 'r') as f:
+        ref_data = [make_ref_datum(line, indel_start, indel_len) for line in f]
+
+    result_folder = os.path.join(result_base_folder, 'result')
+    indel_folder = os.path.join(result_base_folder, 'result_indel')
+    for folder in [result_folder, indel_folder]:
+        if not os.path.exists(folder):
+            os.mkdir(folder)
+
+    # 같은 조건으로 다시 돌리면 체크포인트에 남은 reference 는 건너뛴다.
+    checkpoint_folder = os.path.join(result_base_folder, CHECKPOINT_FOLDER_NAME)
+    # reference 파일이 바뀌었거나 sort 파일이 바뀐 reference 는 다시 분석한다.
+    summaries = load_checkpoint(checkpoint_folder, {
+        'ref_file': os.path.abspath(ref_file),
+        'ref_fingerprint': file_fingerprint(ref_file),
+        'sort_base_folder': os.path.abspath(sort_base_folder),
+        'indel_start': indel_start,
+        'indel_len': indel_len,
+        'compat': compat,
+    }, {datum.file: os.path.join(sort_base_folder, datum.file) for datum in ref_data})
+    if summaries:
+        print('{} 개 reference 는 체크포인트에서 불러옴'.format(len(summaries)))
+
+    pending = [datum for datum in ref_data if datum.file not in summaries]
+    task = partial(analyse_reference, sort_base_folder=sort_base_folder, result_folder=result_folder,
+                   indel_folder=indel_folder, compat=compat, checkpoint_folder=checkpoint_folder)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for datum, summary in zip(pending, executor.map(task, pending) if executor else map(task, pending)):
+            if summary is not None:
+                summaries[datum.file] = summary
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # 끝까지 돌았으면 체크포인트는 필요 없다.
+    clear_checkpoint(checkpoint_folder)
+    return summaries
+
+
 if __name__ == '__main__':
     while True:
         ref_file = input('reference 파일 > ')
@@ -95,86 +273,10 @@ if __name__ == '__main__':
         else:
             break
 
-    with open(ref_file, 'r') as f:
-        for line in f.readlines():
-            sorting_file, barcode, full = line.split(':')
-            sorting_file += '.txt'
-            barcode, full = clean_seqs(barcode).upper(), clean_seqs(full).upper()
-            start = len(full) - indel_start
-            end = start + indel_len
-            ref_data.append(ref_datum(sorting_file, barcode, full, (start, end)))
-
-    counts = defaultdict(dict)
-    for datum in ref_data:
-        indels = []
-        normals = []
-        removed = []
-        total = 0
-
-        try:
-            with open(os.path.join(sort_base_folder, datum.file), 'r') as f:
-                for line in f.readlines():
-                    seqs = clean_seqs(line).upper()
-                    total += 1
-                    pref, psort = get_padding_seqs(datum.full, seqs)
-                    # pref, psort, _, _, _ = align.localms(datum.full, seqs, 5, -4, -2, -0.5)[0]
-                    if (check_insertion(pref, datum.position)
-                            or check_deletion(psort, datum.position, datum.barcode)):
-                        removed.append(seqs)
-                    elif check_indel(psort, datum):
-                        indels.append(seqs)
-                    else:
-                        start = seqs.find(datum.barcode)
-                        end = start + (len(datum.full) - len(datum.barcode))
-                        normals.append(seqs[start:end])
-
-        except FileNotFoundError:
-            print(datum.file + ' < 이런 이름의 파일 없음')
-            continue
-        else:
-            count = defaultdict(dict)
-            for seqs in normals:
-                for idx, seq in enumerate(seqs):
-                    if seq in count[idx]:
-                        count[idx][seq] += 1
-                    else:
-                        count[idx][seq] = 1
-
-            counts[datum.file]['count'] = count
-            counts[datum.file]['ref'] = datum.full[datum.full.find(datum.barcode) + len(datum.barcode):]
-
-        counts[datum.file]['indels'] = str(len(indels))
-        counts[datum.file]['indel_seqs'] = indels
-        counts[datum.file]['removed'] = str(len(removed))
-        counts[datum.file]['normals'] = str(len(normals))
-        counts[datum.file]['total'] = str(total)
+    # 예전 pairwise2 + blosum62 결과와 비교할 때만 쓴다. 아주 느리다.
+    compat = input('blosum62 호환 모드? (y/N) > ').strip().lower() == 'y'
 
-    result_folder = os.path.join(result_base_folder, 'result')
-    indel_folder = os.path.join(result_base_folder, 'result_indel')
-    for folder in [result_folder, indel_folder]:
-        if not os.path.exists(folder):
-            os.mkdir(folder)
+    workers = input('프로세스 갯수 (엔터 치면 {}) > '.format(os.cpu_count())).strip()
+    workers = int(workers) if workers else os.cpu_count()
 
-    for file, data in counts.items():
-        with open(os.path.join(result_folder, file.split('.')[0] + '_count.txt'), 'w') as f:
-            buffer = []
-            buffer.append('-,' + ','.join(data['ref']))
-            buffer.append('A,' + ','.join([str(counts.get('A', 0)) for idx, counts in data['count'].items()]))
-            buffer.append('C,' + ','.join([str(counts.get('C', 0)) for idx, counts in data['count'].items()]))
-            buffer.append('G,' + ','.join([str(counts.get('G', 0)) for idx, counts in data['count'].items()]))
-            buffer.append('T,' + ','.join([str(counts.get('T', 0)) for idx, counts in data['count'].items()]))
-            buffer = [line + '\n' for line in buffer]
-
-            f.writelines(buffer)
-
-        with open(os.path.join(result_folder, file.split('.')[0] + '_info.txt'), 'w') as f:
-            f.writelines([
-                'indel count: ' + data['indels'] + '\n',
-                'remove count: ' + data['removed'] + '\n',
-                'normal count: ' + data['normals'] + '\n',
-                'total count: ' + data['total'] + '\n',
-            ])
-
-        with open(os.path.join(indel_folder, file.split('.')[0] + '.txt'), 'w') as f:
-            data['indel_seqs'] = [datum + '\n' for datum in data['indel_seqs']]
-            f.writelines(data['indel_seqs'])
+    run(ref_file, sort_base_folder, result_base_folder, indel_start, indel_len, workers, compat)
@@ -1,19 +1,33 @@
-from collections import namedtuple
+from collections import Counter, namedtuple
 
 import Levenshtein
 from itertools import product
 
 import os
 
+import numpy as np
+
+from src.reader import read_sample_batches
+
+ReferenceInfo = namedtuple('ReferenceInfo', 'file_name, barcode, wild_seqs')
+
+RESULT_FOLDER_NAME = 'replacement_results'
+
+SUBSTITUTION = 'substitution'
+INDEL = 'indel'
+UNALIGNABLE = 'unalignable'
+# 와일드시퀀스와 편집 거리가 이보다 크면 같은 자리에서 나온 read 로 보지 않는다.
+MAX_DISTANCE = 5
+
 
 def _replace_char(string, char, idx):
     return string[:idx] + char + string[idx + 1:]
 
 
 def get_possible_seqs(wild_seqs, src_seq, dest_seq):
-    results = []
+    # src 가 n 개면 2^n - 1 개가 나오므로 하나씩 만들어서 돌려준다. 분석에서는 쓰지 않고 is_replaced_only 로 바로 검사한다.
     src_indexes = [idx for idx, ch in enumerate(wild_seqs) if ch == src_seq]
-    for src_possibles in product([False, True], repeat=wild_seqs.count(src_seq)):
+    for src_possibles in product([False, True], repeat=len(src_indexes)):
         possible_seq = wild_seqs
         for idx, possible in zip(src_indexes, src_possibles):
             if not possible:
@@ -22,9 +36,18 @@ def get_possible_seqs(wild_seqs, src_seq, dest_seq):
             possible_seq = _replace_char(possible_seq, dest_seq, idx)
 
         if possible_seq != wild_seqs:
-            results.append(possible_seq)
+            yield possible_seq
 
-    return results
+
+def is_replaced_only(wild_seqs, target_seqs, src_seq, dest_seq):
+    # target_seqs 가 wild_seqs 에서 src -> dest 변형만 일어난 시퀀스(변형이 없는 것 포함)인지 위치마다 바로 검사한다.
+    if len(wild_seqs) != len(target_seqs):
+        return False
+
+    for wild, target in zip(wild_seqs, target_seqs):
+        if wild != target and (wild != src_seq or target != dest_seq):
+            return False
+    return True
 
 
 def is_insertion_or_deletion_in_seqs(wild_seqs, target_seqs):
@@ -34,46 +57,172 @@ def is_insertion_or_deletion_in_seqs(wild_seqs, target_seqs):
     return False
 
 
+def classify_seqs_batch(wild_seqs, seqs_list, max_distance=MAX_DISTANCE):
+    # seqs_list 의 read 들을 wild_seqs 기준으로 SUBSTITUTION, INDEL, UNALIGNABLE 중 하나로 분류한다.
+    # 길이 차이가 max_distance 를 넘으면 UNALIGNABLE.
+    # 길이가 같은 read 는 numpy 로 한 번에 hamming 거리를 구해서 1 이하면 교체만 있는 것이므로 opcodes 를 돌리지 않는다.
+    # 나머지만 편집 거리와 is_insertion_or_deletion_in_seqs 로 가른다.
+    results = [None] * len(seqs_list)
+    same_length = []
+    for idx, seqs in enumerate(seqs_list):
+        if len(seqs) == len(wild_seqs):
+            same_length.append(idx)
+        elif abs(len(seqs) - len(wild_seqs)) > max_distance:
+            results[idx] = UNALIGNABLE
+
+    hamming = {}
+    if same_length and wild_seqs:
+        codes = np.frombuffer(''.join(seqs_list[idx] for idx in same_length).encode('ascii'), dtype=np.uint8)
+        distances = (codes.reshape(-1, len(wild_seqs)) != np.frombuffer(wild_seqs.encode('ascii'), dtype=np.uint8))
+        hamming = dict(zip(same_length, distances.sum(axis=1).tolist()))
+        for idx, distance in hamming.items():
+            if distance <= 1:
+                results[idx] = SUBSTITUTION
+
+    for idx in [idx for idx, classified in enumerate(results) if classified is None]:
+        seqs = seqs_list[idx]
+        # hamming 거리는 편집 거리보다 작을 수 없으므로 max_distance 이하면 편집 거리는 구하지 않아도 된다.
+        if hamming.get(idx, max_distance + 1) > max_distance and Levenshtein.distance(wild_seqs, seqs) > max_distance:
+            results[idx] = UNALIGNABLE
+        elif is_insertion_or_deletion_in_seqs(wild_seqs, seqs):
+            results[idx] = INDEL
+        else:
+            results[idx] = SUBSTITUTION
+
+    return results
+
+
 def get_reference_seq_file(file_path):
+    # 한 줄에 파일이름:barcode:와일드시퀀스 (와일드시퀀스는 barcode 뒤 조사 위치부터)
+    # 와일드시퀀스가 없는 예전 형식(파일이름:barcode)도 읽는다.
     def remove_linebreak(seqs):
         return seqs[:-1] if seqs.endswith('\n') else seqs
 
     results = []
     with open(file_path) as f:
         for line in f.readlines():
-            try:
-                file_name, barcode = line.split(':')
-            except ValueError:
-                pass
-            else:
-                reference_info = namedtuple('ReferenceInfo', 'file_name, barcode')
-                results.append(reference_info(file_name, remove_linebreak(barcode)))
+            fields = remove_linebreak(line).split(':')
+            if len(fields) == 2:
+                results.append(ReferenceInfo(fields[0], fields[1].strip().upper(), ''))
+            elif len(fields) == 3:
+                results.append(ReferenceInfo(fields[0], fields[1].strip().upper(), fields[2].strip().upper()))
 
     return results
 
 
-# def analyse(file_name, barcode, target_seqs_number, loc_target_seqs, src_seq, dest_seq):
-#     with open(os.path.join(os.getcwd(), file_name + '.txt')) as f:
-#         for line in f.readlines():
-#             if not is_insertion_or_deletion_in_seqs()
+def analyse(file_name, barcode, wild_seqs, target_seqs_number, loc_target_seqs, src_seq, dest_seq):
+    # barcode 뒤 loc_target_seqs 칸부터 target_seqs_number 개를 잘라서 와일드시퀀스와 비교하고 위치별 변형 갯수를 센다.
+    # 같은 read, 같은 구간은 한 번만 검사한다.
+    wild_seqs = wild_seqs[:target_seqs_number]
+    result = {
+        'total_cnt': 0,
+        'no_barcode_cnt': 0,
+        'indel_cnt': 0,
+        'other_cnt': 0,
+        'unalignable_cnt': 0,
+        'replaced_cnt': 0,
+        'edited_cnt': 0,
+        'position_cnts': [0] * len(wild_seqs),
+    }
+
+    read_counts = Counter()
+    for batch in read_sample_batches(os.path.join(os.getcwd(), file_name + '.txt')):
+        result['total_cnt'] += len(batch)
+        read_counts.update(batch)
+    read_counts.pop(None, None)
+
+    target_counts = Counter()
+    for seqs, cnt in read_counts.items():
+        seqs = seqs.decode('ascii')
+        barcode_pos = seqs.find(barcode)
+        if barcode_pos == -1:
+            result['no_barcode_cnt'] += cnt
+            continue
+
+        start = barcode_pos + len(barcode) + loc_target_seqs
+        target_counts[seqs[start:start + len(wild_seqs)]] += cnt
+
+    # src -> dest 변형만 있는 구간은 위치별로 세고, 나머지는 한 번에 분류한다.
+    others = []
+    for target_seqs, cnt in target_counts.items():
+        if not is_replaced_only(wild_seqs, target_seqs, src_seq, dest_seq):
+            others.append((target_seqs, cnt))
+            continue
+
+        result['replaced_cnt'] += cnt
+        if target_seqs != wild_seqs:
+            result['edited_cnt'] += cnt
+        for idx, (wild, target) in enumerate(zip(wild_seqs, target_seqs)):
+            if wild != target:
+                result['position_cnts'][idx] += cnt
+
+    classified_cnt_keys = {SUBSTITUTION: 'other_cnt', INDEL: 'indel_cnt', UNALIGNABLE: 'unalignable_cnt'}
+    for (_, cnt), classified in zip(others, classify_seqs_batch(wild_seqs, [seqs for seqs, _ in others])):
+        result[classified_cnt_keys[classified]] += cnt
+
+    return result
+
+
+def write_result(path, wild_seqs, src_seq, result):
+    # 위치별 변형 비율은 src -> dest 변형만 있는 read 중에서의 비율이다.
+    with open(path, 'w') as f:
+        f.write('{}\n'.format(wild_seqs))
+        f.write('--------\n')
+        for idx, wild in enumerate(wild_seqs):
+            if wild != src_seq:
+                continue
+            cnt = result['position_cnts'][idx]
+            rates = float(cnt) / result['replaced_cnt'] * 100 if result['replaced_cnt'] else 0
+            f.write('{} {} : {} : {}/{}\n'.format(idx + 1, wild, rates, cnt, result['replaced_cnt']))
+        f.write('--------\n')
+        f.write('edited : {}\n'.format(result['edited_cnt']))
+        f.write('replaced only : {}\n'.format(result['replaced_cnt']))
+        f.write('indel : {}\n'.format(result['indel_cnt']))
+        f.write('other : {}\n'.format(result['other_cnt']))
+        f.write('unalignable : {}\n'.format(result['unalignable_cnt']))
+        f.write('no barcode : {}\n'.format(result['no_barcode_cnt']))
+        f.write('total : {}\n'.format(result['total_cnt']))
 
 
 def command():
     print('--- replacement 분석기 ---')
 
-    target_seqs_number = input('비율 분석 시퀸스 갯수 : ')
+    target_seqs_number = int(input('비율 분석 시퀸스 갯수 : '))
 
     print('위치 ex. TTTNNNNNATCG barcode가 TTT고 조사 위치가 ATCG라면 5 입력')
-    loc_target_seqs_after_barcode = input('비율 분석 시퀸스 위치(barcode 뒤로 몇칸) : ')
+    loc_target_seqs_after_barcode = int(input('비율 분석 시퀸스 위치(barcode 뒤로 몇칸) : '))
 
     print('변형 조사 (원본 -> 변이)')
-    replacement_src_seq = input('변형 조사 원본 시퀸스 : ')
-    replacement_dest_seq = input('변형 조사 변이 시퀸스 : ')
+    replacement_src_seq = input('변형 조사 원본 시퀸스 : ').strip().upper()
+    replacement_dest_seq = input('변형 조사 변이 시퀸스 : ').strip().upper()
 
+    print('reference seq file 은 한 줄에 파일이름:barcode:와일드시퀀스(조사 위치부터)')
     file_name = input('reference seq file 위치 : ')
 
-    for reference_infos in get_reference_seq_file(os.path.join(os.getcwd(), file_name)):
-        print(reference_infos)
+    result_folder = os.path.join(os.getcwd(), RESULT_FOLDER_NAME)
+    if not os.path.exists(result_folder):
+        os.makedirs(result_folder)
+
+    with open(os.path.join(result_folder, 'result_info.txt'), 'w') as info_f:
+        for reference_infos in get_reference_seq_file(os.path.join(os.getcwd(), file_name)):
+            if not reference_infos.wild_seqs:
+                print('{} : 와일드시퀀스가 없음'.format(reference_infos.file_name))
+                continue
+
+            try:
+                result = analyse(reference_infos.file_name, reference_infos.barcode, reference_infos.wild_seqs,
+                                 target_seqs_number, loc_target_seqs_after_barcode,
+                                 replacement_src_seq, replacement_dest_seq)
+            except FileNotFoundError:
+                print('{}.txt not found.'.format(reference_infos.file_name))
+                continue
+
+            write_result(os.path.join(result_folder, reference_infos.file_name + '.txt'),
+                         reference_infos.wild_seqs[:target_seqs_number], replacement_src_seq, result)
+            rates = float(result['edited_cnt']) / result['replaced_cnt'] * 100 if result['replaced_cnt'] else 0
+            info_f.write('{} : {} : {}/{}\n'.format(reference_infos.file_name, rates, result['edited_cnt'],
+                                                    result['replaced_cnt']))
+            info_f.flush()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,50 @@
+import unittest
+
+from src.analyser.aligner import is_gapless_match, local_align
+
+
+class LocalAlignTest(unittest.TestCase):
+    def test_local_align_should_pad_unaligned_ends(self):
+        self.assertTupleEqual(local_align('ACGT', 'CG'), ('ACGT', '-CG-'))
+        self.assertTupleEqual(local_align('TTACGTAA', 'GGGACGTCC'), ('-TTACGTAA', 'GGGACGTCC'))
+        self.assertTupleEqual(local_align('AAAACCCC', 'CCCCGGGG'), ('AAAACCCC----', '----CCCCGGGG'))
+
+    def test_local_align_with_deletion(self):
+        self.assertIn(local_align('ACGTTTGCA', 'ACGTGCA'), [
+            ('ACGTTTGCA', 'ACG--TGCA'),
+            ('ACGTTTGCA', 'ACGT--GCA'),
+        ])
+
+    def test_local_align_with_insertion(self):
+        self.assertIn(local_align('ACGTGCA', 'ACGTTTGCA'), [
+            ('ACG--TGCA', 'ACGTTTGCA'),
+            ('ACGT--GCA', 'ACGTTTGCA'),
+        ])
+
+    def test_local_align_should_prefer_mismatch_over_gaps(self):
+        self.assertTupleEqual(local_align('ACGTACGTAC', 'ACGTTCGTAC'), ('ACGTACGTAC', 'ACGTTCGTAC'))
+
+
+class GaplessMatchTest(unittest.TestCase):
+    def test_exact_and_one_mismatch_should_be_gapless(self):
+        ref = 'ACGTACCTGA'
+        self.assertTrue(is_gapless_match(ref, 'TT' + ref + 'GG'))
+        self.assertTrue(is_gapless_match(ref, 'TT' + 'ACGTTCCTGA' + 'GG'))
+
+    def test_gapless_match_should_agree_with_local_align(self):
+        ref = 'ACGTACCTGA'
+        for sort in ['TTACGTTCCTGAGG', 'ACGTACCTGT', 'TACGTACTGAG']:
+            if is_gapless_match(ref, sort):
+                self.assertEqual(local_align(ref, sort)[1], sort)
+
+    def test_indel_or_two_mismatches_should_not_be_gapless(self):
+        ref = 'ACGTACCTGA'
+        self.assertFalse(is_gapless_match(ref, 'TTACGTACTGAGG'))
+        self.assertFalse(is_gapless_match(ref, 'TTACGTTCCTCAGG'))
+
+    def test_ambiguous_offsets_should_not_be_gapless(self):
+        self.assertFalse(is_gapless_match('AAAAAC', 'AAAAAAGAAAAA'))
+
+
+if __name__ == '__main__':
+    unittest.main()
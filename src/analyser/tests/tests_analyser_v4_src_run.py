@@ -0,0 +1,205 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from Levenshtein import editops
+
+import analyser_v4_src_run
+from analyser_v4_src_run import do, is_mutated
+from src.analyser.checkpoint import CHECKPOINT_FOLDER_NAME, file_fingerprint, load_checkpoint, save_target
+
+
+def _is_mutated_by_editops(wild_seq, line, target_end_pos, backward_target_length):
+    # is_window_unchanged 로 거르지 않고 editops 만으로 판단한 결과
+    window_start = target_end_pos - backward_target_length
+    return any(window_start <= pos <= target_end_pos and op != 'replace' and line[line_pos] != 'N'
+               for op, pos, line_pos in editops(wild_seq, line))
+
+
+def _outcome(func, *args):
+    # 읽은 시퀀스 끝에서 지워진 경우 line[위치] 가 IndexError 를 낸다. (예전부터 그렇다) 그것도 같아야 한다.
+    try:
+        return func(*args)
+    except IndexError:
+        return IndexError
+
+
+class IsMutatedTest(unittest.TestCase):
+    def _assert_same_as_editops(self, wild_seq, lines, windows):
+        for line in lines:
+            for target_end_pos, backward_target_length in windows:
+                with self.subTest(line=line, target_end_pos=target_end_pos,
+                                  backward_target_length=backward_target_length):
+                    args = (wild_seq, line, target_end_pos, backward_target_length)
+                    self.assertEqual(_outcome(is_mutated, *args), _outcome(_is_mutated_by_editops, *args))
+
+    def _windows(self, wild_seq):
+        # 맨 앞, 가운데, 맨 끝, 와일드 길이를 넘는 위치
+        return [(0, 0), (2, 2), (3, 0), (10, 4), (len(wild_seq) - 1, 3), (len(wild_seq), 3), (len(wild_seq), 0),
+                (len(wild_seq) + 5, 4)]
+
+    def test_indel_at_both_ends(self):
+        wild_seq = 'ACGTACGTTGCAACGTAGCT'
+        lines = [
+            wild_seq,
+            'T' + wild_seq, 'TT' + wild_seq, wild_seq[1:], wild_seq[2:],
+            wild_seq + 'T', wild_seq + 'TT', wild_seq[:-1], wild_seq[:-2],
+            'G' + wild_seq[:-1], wild_seq[1:] + 'G',
+            'N' + wild_seq, wild_seq + 'N',
+            wild_seq[:10] + 'A' + wild_seq[10:], wild_seq[:10] + wild_seq[11:],
+            wild_seq[:10] + 'C' + wild_seq[11:],
+        ]
+        self._assert_same_as_editops(wild_seq, lines, self._windows(wild_seq))
+
+    def test_window_past_read_length(self):
+        wild_seq = 'ACGTACGTTGCAACGTAGCT'
+        lines = [wild_seq[:10], wild_seq[:5], wild_seq[:1], '', wild_seq[5:], wild_seq[:10] + 'A']
+        self._assert_same_as_editops(wild_seq, lines, self._windows(wild_seq) + [(15, 2), (12, 1)])
+
+    def test_homopolymer_prefix_and_suffix_overlap(self):
+        wild_seq = 'CCAAAAAAGG'
+        lines = [
+            'CCAAAAAAAGG', 'CCAAAAAGG', 'CCAAAAAAAAGG', 'CCAAAAGG',
+            'CAAAAAAGG', 'CCCAAAAAAGG', 'CCAAAAAAG', 'CCAAAAAAGGG',
+            'AAAAAAAA', 'CCAAAAAAAAAAAAAAGG', 'CCAANAAAGG', 'CCAAAANAAGG',
+        ]
+        self._assert_same_as_editops(wild_seq, lines, self._windows(wild_seq) + [(5, 2), (8, 5), (4, 1)])
+
+        wild_seq = 'AAAAAAAAAA'
+        lines = ['A' * length for length in range(0, 14)] + ['N' + wild_seq, wild_seq + 'N', 'AAAAANAAAAA']
+        self._assert_same_as_editops(wild_seq, lines, self._windows(wild_seq) + [(5, 2), (9, 9)])
+
+
+class DoTestCase(unittest.TestCase):
+    # 임시 폴더에 인풋 파일과 샘플 파일을 만들고, 결과(BASE_DIR/analyse_results)도 임시 폴더에 쓰게 한다.
+    wild_seq = 'ACGTACGTTGCAACGTAGCT'
+    target = 'TTGCAACG'
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.sample_folder = os.path.join(self.tmp.name, 'samples')
+        os.mkdir(self.sample_folder)
+        self.result_folder = os.path.join(self.tmp.name, 'analyse_results')
+        patch = mock.patch.object(analyser_v4_src_run, 'BASE_DIR', self.tmp.name)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _write_input(self, names):
+        path = os.path.join(self.tmp.name, 'targets.txt')
+        with open(path, 'w') as f:
+            for name in names:
+                f.write('{} : {} : {}\n'.format(name, self.wild_seq, self.target))
+        return path
+
+    def _write_sample(self, name, lines):
+        with open(os.path.join(self.sample_folder, name + '.txt'), 'w') as f:
+            f.writelines(line + '\n' for line in lines)
+
+    def _read_result(self, name):
+        with open(os.path.join(self.result_folder, name + '.txt')) as f:
+            return f.read()
+
+    def _do(self, input_file, workers=1):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return do(input_file, 5, self.sample_folder, workers)
+
+    def _mutated(self, pos, base='A'):
+        # 사용자 지정 위치(10~15) 안에 base 를 끼워 넣은 read
+        return self.wild_seq[:pos] + base + self.wild_seq[pos:]
+
+
+class DoWorkersTest(DoTestCase):
+    def test_workers_should_write_same_results_in_input_order(self):
+        names = ['bc{}'.format(idx) for idx in range(6)]
+        for idx, name in enumerate(names):
+            self._write_sample(name, [self._mutated(10 + idx % 5), self.wild_seq] * (idx + 1) +
+                               [self._mutated(12, 'C')] * idx)
+        input_file = self._write_input(names)
+        # 잘못된 타겟 줄은 건너뛴다.
+        with open(input_file, 'a') as f:
+            f.write('bad : ACGT : XYZ\n')
+
+        outputs = []
+        for workers in [1, 2]:
+            final_results = self._do(input_file, workers)
+            outputs.append((final_results, {name: self._read_result(name) for name in names + ['result_info']}))
+            shutil.rmtree(self.result_folder)
+
+        self.assertEqual(outputs[0], outputs[1])
+        final_results, files = outputs[0]
+        self.assertEqual(list(final_results), names)
+        self.assertEqual([line.split(' : ')[0] for line in files['result_info'].splitlines()], names)
+
+
+class CountingTest(DoTestCase):
+    def test_counts_should_be_weighted_by_read_multiplicity(self):
+        first, second = self._mutated(11, 'T'), self._mutated(12)
+        replaced = self.wild_seq[:12] + 'T' + self.wild_seq[13:]
+        self._write_sample('bc1', [
+            first, self.wild_seq, second, first.lower(), 'ACGTXX', '', second, ' {} '.format(first), replaced,
+            self.wild_seq, second, 'hello',
+        ])
+
+        final_results = self._do(self._write_input(['bc1']))
+
+        # 잘못된 줄과 빈 줄도 전체 라인 수에는 들어간다.
+        self.assertDictEqual(final_results['bc1'], {
+            'total_cnt': 12,
+            'mutated_cnt': 6,
+            'mutated_rates': 6 / 12 * 100,
+        })
+        # 변형 시퀀스는 처음 나온 순서대로 갯수와 함께 쓴다.
+        self.assertEqual(self._read_result('bc1'), '\n'.join([
+            self.wild_seq,
+            '--------',
+            '{} X 3'.format(first),
+            '{} X 3'.format(second),
+            '--------',
+            'mutation rates : 50.0 %',
+        ]))
+        self.assertEqual(self._read_result('result_info'), 'bc1 : 50.0 : 6/12\n')
+
+
+class ResumeTest(DoTestCase):
+    def test_resume_should_write_restored_and_new_targets_once_in_input_order(self):
+        names = ['bc1', 'bc2', 'bc3', 'bc4']
+        for name in names:
+            self._write_sample(name, [self._mutated(12), self.wild_seq])
+        input_file = self._write_input(names)
+
+        # bc1, bc3 은 앞에서 끝난 것으로 체크포인트를 미리 남긴다. 다시 분석하면 값이 달라지므로 구분된다.
+        checkpoint_folder = os.path.join(self.result_folder, CHECKPOINT_FOLDER_NAME)
+        load_checkpoint(checkpoint_folder, {
+            'input_file': os.path.abspath(input_file),
+            'input_fingerprint': file_fingerprint(input_file),
+            'backward_target_length': 5,
+            'dest_folder': os.path.abspath(self.sample_folder),
+        })
+        restored = {'total_cnt': 4, 'mutated_cnt': 1, 'mutated_rates': 25.0}
+        for name in ['bc1', 'bc3']:
+            save_target(checkpoint_folder, name, restored, os.path.join(self.sample_folder, name + '.txt'))
+
+        final_results = self._do(input_file, 2)
+
+        analysed = {'total_cnt': 2, 'mutated_cnt': 1, 'mutated_rates': 50.0}
+        self.assertEqual(list(final_results), names)
+        self.assertDictEqual(final_results, {'bc1': restored, 'bc2': analysed, 'bc3': restored, 'bc4': analysed})
+        self.assertEqual(self._read_result('result_info'), ''.join([
+            'bc1 : 25.0 : 1/4\n',
+            'bc2 : 50.0 : 1/2\n',
+            'bc3 : 25.0 : 1/4\n',
+            'bc4 : 50.0 : 1/2\n',
+        ]))
+        # 체크포인트에서 불러온 타겟은 다시 분석하지 않고, 끝까지 돌면 체크포인트를 지운다.
+        self.assertFalse(os.path.exists(os.path.join(self.result_folder, 'bc1.txt')))
+        self.assertTrue(os.path.exists(os.path.join(self.result_folder, 'bc2.txt')))
+        self.assertFalse(os.path.exists(checkpoint_folder))
+
+
+if __name__ == '__main__':
+    unittest.main()
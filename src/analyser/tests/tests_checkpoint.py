@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+
+from src.analyser.checkpoint import file_fingerprint, load_checkpoint, save_target
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmp.name, '.checkpoint')
+        self.params = {'input_file': 'targets.txt', 'backward_target_length': 10}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume_with_same_params_should_return_saved_targets(self):
+        self.assertDictEqual(load_checkpoint(self.folder, self.params), {})
+        save_target(self.folder, 'bc1', {'mutated_cnt': 1, 'total_cnt': 10})
+        save_target(self.folder, 'bc2', {'mutated_cnt': 0, 'total_cnt': 3})
+
+        self.assertDictEqual(load_checkpoint(self.folder, dict(self.params)), {
+            'bc1': {'mutated_cnt': 1, 'total_cnt': 10},
+            'bc2': {'mutated_cnt': 0, 'total_cnt': 3},
+        })
+
+    def test_different_params_should_start_over(self):
+        load_checkpoint(self.folder, self.params)
+        save_target(self.folder, 'bc1', {'mutated_cnt': 1, 'total_cnt': 10})
+
+        self.assertDictEqual(load_checkpoint(self.folder, dict(self.params, backward_target_length=5)), {})
+        self.assertDictEqual(load_checkpoint(self.folder, self.params), {})
+
+    def test_changed_input_fingerprint_should_start_over(self):
+        input_file = os.path.join(self.tmp.name, 'targets.txt')
+        with open(input_file, 'w') as f:
+            f.write('bc1:ACGT:CG\n')
+        params = dict(self.params, input_fingerprint=file_fingerprint(input_file))
+        load_checkpoint(self.folder, params)
+        save_target(self.folder, 'bc1', {'mutated_cnt': 1, 'total_cnt': 10})
+
+        with open(input_file, 'a') as f:
+            f.write('bc2:ACGT:CG\n')
+        self.assertDictEqual(load_checkpoint(self.folder, dict(self.params, input_fingerprint=file_fingerprint(
+            input_file))), {})
+
+    def test_changed_sample_file_should_drop_target(self):
+        source_paths = {}
+        for name in ['bc1', 'bc2', 'bc3']:
+            source_paths[name] = os.path.join(self.tmp.name, name + '.txt')
+            with open(source_paths[name], 'w') as f:
+                f.write('ACGT\n')
+
+        load_checkpoint(self.folder, self.params, source_paths)
+        for name in ['bc1', 'bc2', 'bc3']:
+            save_target(self.folder, name, {'mutated_cnt': 0, 'total_cnt': 1}, source_paths[name])
+        # bc1 은 내용이 늘었고, bc2 는 지워졌다.
+        with open(source_paths['bc1'], 'a') as f:
+            f.write('ACGA\n')
+        os.remove(source_paths['bc2'])
+
+        self.assertDictEqual(load_checkpoint(self.folder, self.params, source_paths), {
+            'bc3': {'mutated_cnt': 0, 'total_cnt': 1},
+        })
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from src.analyser import frequency
+from src.analyser.frequency import BASES, add_base_counts, analyse_reference, make_ref_datum, run
+
+
+class BaseCountsTest(unittest.TestCase):
+    def test_add_base_counts_should_count_each_position(self):
+        counts = add_base_counts(np.zeros((4, 0), dtype=np.int64), ['ACG', 'AGG', 'TC'])
+
+        self.assertListEqual(counts.tolist(), [
+            [2, 0, 0],
+            [0, 2, 0],
+            [0, 1, 2],
+            [1, 0, 0],
+        ])
+
+    def test_add_base_counts_should_grow_with_longer_block(self):
+        counts = add_base_counts(np.zeros((4, 0), dtype=np.int64), ['AC'])
+        counts = add_base_counts(counts, ['ACGT'])
+        counts = add_base_counts(counts, [])
+
+        self.assertListEqual(counts.tolist(), [
+            [2, 0, 0, 0],
+            [0, 2, 0, 0],
+            [0, 0, 1, 0],
+            [0, 0, 0, 1],
+        ])
+
+
+class AnalyseReferenceTestCase(unittest.TestCase):
+    # 임시 폴더에 reference 파일과 sort 파일을 만든다.
+    barcode = 'ACGTAC'
+    full = 'ACGTACGGATCCTTAGCATGCAAGCT'
+    indel_start = 10
+    indel_len = 6
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.sort_folder = os.path.join(self.tmp.name, 'sort')
+        os.mkdir(self.sort_folder)
+
+    def _write_sort(self, name, lines):
+        with open(os.path.join(self.sort_folder, name + '.txt'), 'w') as f:
+            f.writelines(line + '\n' for line in lines)
+
+    def _write_ref(self, names):
+        path = os.path.join(self.tmp.name, 'ref.txt')
+        with open(path, 'w') as f:
+            f.writelines('{}:{}:{}\n'.format(name, self.barcode, self.full) for name in names)
+        return path
+
+    def _make_result_folders(self, name):
+        base_folder = os.path.join(self.tmp.name, name)
+        os.mkdir(base_folder)
+        for folder in ['result', 'result_indel']:
+            os.mkdir(os.path.join(base_folder, folder))
+        return base_folder
+
+    def _read(self, *paths):
+        with open(os.path.join(self.tmp.name, *paths), 'rb') as f:
+            return f.read()
+
+    def _substitute(self, positions):
+        seqs = list(self.full)
+        for pos in positions:
+            seqs[pos] = 'A' if seqs[pos] != 'A' else 'C'
+        return ''.join(seqs)
+
+
+class AnalyseReferenceTest(AnalyseReferenceTestCase):
+    def test_analyse_reference_should_stream_indel_reads_and_write_results(self):
+        outside = self._substitute([8])
+        indels = [self._substitute([17, 19]), 'TT' + self._substitute([16, 18, 20])]
+        removed = self.full[:9] + self.full[12:]
+        self._write_sort('bc1', [
+            self.full, indels[0], outside, '', removed, 'TT' + self.full.lower(), indels[1], 'NNNN', self.full,
+        ])
+        self._make_result_folders('out')
+        datum = make_ref_datum('bc1:{}:{}'.format(self.barcode, self.full), self.indel_start, self.indel_len)
+
+        # normal read 를 여러 block 으로 나눠 세게 한다.
+        with mock.patch.object(frequency, 'COUNT_BLOCK_SIZE', 2):
+            summary = analyse_reference(datum, self.sort_folder, os.path.join(self.tmp.name, 'out', 'result'),
+                                        os.path.join(self.tmp.name, 'out', 'result_indel'))
+
+        # 시퀀스가 없는 줄은 세지 않는다.
+        self.assertDictEqual(summary, {'indels': '2', 'removed': '1', 'normals': '4', 'total': '7'})
+        self.assertEqual(self._read('out', 'result_indel', 'bc1.txt'), ''.join(seqs + '\n' for seqs in indels).encode())
+        self.assertEqual(self._read('out', 'result', 'bc1_info.txt'),
+                         b'indel count: 2\nremove count: 1\nnormal count: 4\ntotal count: 7\n')
+
+        # normal read 는 바코드부터 reference 에서 바코드를 뺀 길이만큼 센다.
+        width = len(self.full) - len(self.barcode)
+        normals = [self.full[:width], outside[:width], self.full[:width], self.full[:width]]
+        lines = ['-,' + ','.join(self.full[len(self.barcode):])]
+        for base in BASES:
+            lines.append(base + ',' + ','.join(str(sum(seqs[pos] == base for seqs in normals)) for pos in range(width)))
+        self.assertEqual(self._read('out', 'result', 'bc1_count.txt'), ''.join(line + '\n' for line in lines).encode())
+
+    def test_missing_sort_file_should_be_skipped(self):
+        self._make_result_folders('out')
+        datum = make_ref_datum('nothing:{}:{}'.format(self.barcode, self.full), self.indel_start, self.indel_len)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            summary = analyse_reference(datum, self.sort_folder, os.path.join(self.tmp.name, 'out', 'result'),
+                                        os.path.join(self.tmp.name, 'out', 'result_indel'))
+
+        self.assertIsNone(summary)
+        self.assertListEqual(os.listdir(os.path.join(self.tmp.name, 'out', 'result')), [])
+        self.assertListEqual(os.listdir(os.path.join(self.tmp.name, 'out', 'result_indel')), [])
+
+
+class RunTest(AnalyseReferenceTestCase):
+    def test_workers_should_write_same_files(self):
+        names = ['bc{}'.format(idx) for idx in range(5)]
+        for idx, name in enumerate(names):
+            others = [self._substitute([17, 19 + idx % 3]), self._substitute([8]), self.full[:9] + self.full[12:]]
+            self._write_sort(name, [self.full] * (idx + 1) + others * idx)
+        ref_file = self._write_ref(names + ['missing'])
+
+        summaries = []
+        for workers in [1, 2]:
+            base_folder = os.path.join(self.tmp.name, 'out{}'.format(workers))
+            os.mkdir(base_folder)
+            with contextlib.redirect_stdout(io.StringIO()):
+                summaries.append(run(ref_file, self.sort_folder, base_folder, self.indel_start, self.indel_len,
+                                     workers))
+
+        self.assertDictEqual(summaries[0], summaries[1])
+        self.assertListEqual(list(summaries[0]), [name + '.txt' for name in names])
+        for folder, suffixes in [('result', ['_count.txt', '_info.txt']), ('result_indel', ['.txt'])]:
+            self.assertCountEqual(os.listdir(os.path.join(self.tmp.name, 'out2', folder)),
+                                  [name + suffix for name in names for suffix in suffixes])
+            for file in os.listdir(os.path.join(self.tmp.name, 'out1', folder)):
+                with self.subTest(folder=folder, file=file):
+                    self.assertEqual(self._read('out1', folder, file), self._read('out2', folder, file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,10 @@
+import os
+import tempfile
+import types
 import unittest
 
-from src.analyser.replacement import get_possible_seqs, is_insertion_or_deletion_in_seqs
+from src.analyser.replacement import (INDEL, SUBSTITUTION, UNALIGNABLE, analyse, classify_seqs_batch,
+                                      get_possible_seqs, get_reference_seq_file, is_insertion_or_deletion_in_seqs, is_replaced_only)
 
 
 class ReplacementTest(unittest.TestCase):
@@ -28,6 +32,90 @@ class ReplacementTest(unittest.TestCase):
         self.assertFalse(is_insertion_or_deletion_in_seqs(wild_seqs, replacement_seqs))
         self.assertFalse(is_insertion_or_deletion_in_seqs(wild_seqs, wild_seqs))
 
+    def test_get_possible_seqs_should_be_lazy(self):
+        self.assertIsInstance(get_possible_seqs('A' * 40, 'A', 'G'), types.GeneratorType)
+
+    def test_is_replaced_only(self):
+        wild_seqs = 'TACAG'
+
+        self.assertTrue(is_replaced_only(wild_seqs, 'TGCGG', 'A', 'G'))
+        self.assertTrue(is_replaced_only(wild_seqs, wild_seqs, 'A', 'G'))
+        self.assertFalse(is_replaced_only(wild_seqs, 'TACAT', 'A', 'G'))
+        self.assertFalse(is_replaced_only(wild_seqs, 'TCCAG', 'A', 'G'))
+        self.assertFalse(is_replaced_only(wild_seqs, 'TACA', 'A', 'G'))
+
+    def test_classify_seqs_batch(self):
+        wild_seqs = 'TACAGTTACA'
+        seqs_list = [
+            wild_seqs,
+            'TACAGTTACT',
+            'TCAGTTACAA',
+            'TACAAGTTACA',
+            'TACA',
+            'GGGGGGGGGG',
+        ]
+
+        self.assertListEqual(classify_seqs_batch(wild_seqs, seqs_list, max_distance=3), [
+            SUBSTITUTION,
+            SUBSTITUTION,
+            INDEL,
+            INDEL,
+            UNALIGNABLE,
+            UNALIGNABLE,
+        ])
+
+    def test_get_reference_seq_file_with_and_without_wild_seqs(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('s1:TTTCC:acagt\ns2:AAAA\ns3: ttcc :ACGT\ns4:gg \nbroken\n')
+
+        try:
+            references = get_reference_seq_file(f.name)
+        finally:
+            os.remove(f.name)
+
+        self.assertListEqual([tuple(reference) for reference in references], [
+            ('s1', 'TTTCC', 'ACAGT'),
+            ('s2', 'AAAA', ''),
+            ('s3', 'TTCC', 'ACGT'),
+            ('s4', 'GG', ''),
+        ])
+
+
+class AnalyseTest(unittest.TestCase):
+    def test_analyse_should_count_each_case(self):
+        def read(window, tail='GGT'):
+            # barcode(TTT) 뒤 2칸 다음부터가 조사 구간이다.
+            return 'CC' + 'TTT' + 'GC' + window + tail
+
+        lines = [
+            read('ACAGAC'), read('ACAGAC'),
+            read('GCAGAC'), read('GCAGAC').lower(), read('GCGGAC'),
+            # A -> G 가 아닌 교체
+            read('ACTGAC'),
+            # 조사 구간 안에서 A 하나가 빠짐
+            read('ACGAC'),
+            # read 가 조사 구간 중간에서 끝남, 조사 구간이 아예 없음
+            read('ACA', ''), read('', ''),
+            'CCGGACAGACGGT', 'hello', '',
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            file_name = os.path.join(tmp, 'bc1')
+            with open(file_name + '.txt', 'w') as f:
+                f.writelines(line + '\n' for line in lines)
+
+            result = analyse(file_name, 'TTT', 'ACAGACGGT', 6, 2, 'A', 'G')
+
+        self.assertDictEqual(result, {
+            'total_cnt': 12,
+            'no_barcode_cnt': 1,
+            'indel_cnt': 2,
+            'other_cnt': 1,
+            'unalignable_cnt': 1,
+            'replaced_cnt': 5,
+            'edited_cnt': 3,
+            'position_cnts': [3, 0, 1, 0, 0, 0],
+        })
+
 
 if __name__ == '__main__':
     unittest.main()
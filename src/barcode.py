@@ -0,0 +1,32 @@
+KMER_SIZE = 10
+KMER_WINDOW = 5
+
+
+def get_kmers(seqs, k):
+    return [seqs[idx:idx + k] for idx in range(len(seqs) - k + 1)]
+
+
+def get_minimizers(seqs, k=KMER_SIZE, w=KMER_WINDOW):
+    # 연속된 w 개의 k-mer 중 사전순으로 가장 작은 것만 남긴다.
+    # 바코드 안쪽에 온전히 들어가는 윈도우는 read 안에서도 같은 윈도우이므로,
+    # 바코드의 minimizer 는 바코드를 포함하는 모든 read 의 minimizer 에 반드시 들어있다.
+    kmers = get_kmers(seqs, k)
+    return {min(kmers[idx:idx + w]) for idx in range(len(kmers) - w + 1)}
+
+
+def build_barcode_table(barcode_maps):
+    # 바코드 길이별로 {바코드: [키, ...]} 테이블을 만든다. 같은 바코드를 쓰는 키가 여럿일 수 있다.
+    barcode_table = {}
+    for key, barcode in barcode_maps.items():
+        barcode_table.setdefault(len(barcode), {}).setdefault(barcode.upper(), []).append(key)
+    return barcode_table
+
+
+def match_barcodes(seqs, barcode_table):
+    # read 를 바코드 길이만큼의 윈도우로 한번씩만 훑어서 들어있는 모든 바코드의 키를 찾는다.
+    keys = []
+    for length, barcodes in barcode_table.items():
+        windows = {seqs[idx:idx + length] for idx in range(len(seqs) - length + 1)}
+        for barcode in barcodes.keys() & windows:
+            keys.extend(barcodes[barcode])
+    return keys
@@ -0,0 +1,47 @@
+import heapq
+import itertools
+import tempfile
+
+from operator import itemgetter
+
+COLLAPSE_LIMIT = 1000000
+
+
+def _spill(counts):
+    f = tempfile.TemporaryFile('w+')
+    for seqs in sorted(counts):
+        f.write('{}\t{}\n'.format(seqs, counts[seqs]))
+    f.seek(0)
+    return f
+
+
+def _read_spill(f):
+    for line in f:
+        seqs, count = line.rstrip('\n').split('\t')
+        yield seqs, int(count)
+
+
+def collapse_seqs(seqs_list, limit=COLLAPSE_LIMIT):
+    # 같은 시퀀스를 (시퀀스, 갯수) 하나로 합친다.
+    # 서로 다른 시퀀스가 limit 개를 넘으면 정렬해서 임시 파일로 내리고, 마지막에 파일들을 병합하면서 갯수를 더한다.
+    counts = {}
+    spills = []
+    for seqs in seqs_list:
+        counts[seqs] = counts.get(seqs, 0) + 1
+        if len(counts) >= limit:
+            spills.append(_spill(counts))
+            counts = {}
+
+    if not spills:
+        for seqs, count in counts.items():
+            yield seqs, count
+        return
+
+    spills.append(_spill(counts))
+    try:
+        merged = heapq.merge(*[_read_spill(f) for f in spills])
+        for seqs, group in itertools.groupby(merged, key=itemgetter(0)):
+            yield seqs, sum(count for _, count in group)
+    finally:
+        for f in spills:
+            f.close()
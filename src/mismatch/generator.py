@@ -1,6 +1,9 @@
 import re
-from collections import namedtuple
-from itertools import repeat, permutations
+import sys
+from collections import Counter, namedtuple
+from functools import partial
+from itertools import chain, combinations, combinations_with_replacement, permutations, product, repeat
+from math import comb
 
 import os
 
@@ -17,6 +20,9 @@ TARGET_SEQ_LENGTH = 20
 SECOND_SEQ = FIRST_SEQ + TARGET_SEQ_LENGTH
 THIRD_SEQ = SECOND_SEQ + 3
 FORTH_SEQ = THIRD_SEQ + 3
+WINDOW = (FIRST_SEQ, SECOND_SEQ, THIRD_SEQ, FORTH_SEQ)
+
+WRITE_BUFFER_SIZE = 10000
 
 output_folder = os.path.join(os.getcwd(), BASE_FOLDER_NAME, OUTPUT_FOLDER_NAME)
 
@@ -55,56 +61,151 @@ def _put_file_extension(file):
 
 
 def generate_one_mismatch(seqs):
-    results = []
     key = '1MM-{}position-{}to{}'
     for idx, seq in enumerate(seqs):
+        prefix, suffix = seqs[:idx], seqs[idx + 1:]
         for revised_seq in SEQUENCE:
             if revised_seq == seq:
                 continue
-            results.append((key.format(idx + 1, seq, revised_seq),
-                            replace_string(seqs, idx, revised_seq)))
-
-    return results
+            yield key.format(idx + 1, seq, revised_seq), prefix + revised_seq + suffix
 
 
 def generate_two_mismatch(seqs):
     if len(seqs) < 2:
         raise Exception('too short sequences!')
 
-    results = []
+    return _generate_two_mismatch(seqs)
+
+
+def _generate_two_mismatch(seqs):
     key = '2MM-({},{})positions-({}to{},{}to{})'
-    for index_pair in _select_two_index(len(seqs)):
-        orig_seq_first = seqs[index_pair[0]]
-        orig_seq_second = seqs[index_pair[1]]
-        for candidate_pair in _generate_sequence_combinations(orig_seq_first, orig_seq_second):
-            result = replace_string(seqs, index_pair[0], candidate_pair[0])
-            result = replace_string(result, index_pair[1], candidate_pair[1])
-            results.append((key.format(index_pair[0] + 1, index_pair[1] + 1,
-                                       orig_seq_first, candidate_pair[0],
-                                       orig_seq_second, candidate_pair[1]),
-                            result))
-    return results
+    # 조합은 원래 염기 두 개로만 정해지므로 한 번씩만 만든다. 같은 set 을 다시 쓰므로 순회 순서도 그대로이다.
+    combinations = {}
+    for first, second in _select_two_index(len(seqs)):
+        orig_seq_first = seqs[first]
+        orig_seq_second = seqs[second]
+        if (orig_seq_first, orig_seq_second) not in combinations:
+            combinations[orig_seq_first, orig_seq_second] = _generate_sequence_combinations(orig_seq_first,
+                                                                                           orig_seq_second)
+
+        prefix, middle, suffix = seqs[:first], seqs[first + 1:second], seqs[second + 1:]
+        for candidate_first, candidate_second in combinations[orig_seq_first, orig_seq_second]:
+            yield (key.format(first + 1, second + 1, orig_seq_first, candidate_first, orig_seq_second, candidate_second),
+                   prefix + candidate_first + middle + candidate_second + suffix)
 
 
 def add_one_bulge(seqs):
-    results = []
     key = 'DNA1bulge-{}position-{}'
     for idx in range(1, len(seqs)):
+        prefix, suffix = seqs[:idx], seqs[idx:]
         for seq in SEQUENCE_STRING:
-            results.append((key.format(idx, seq), seqs[:idx] + seq + seqs[idx:]))
-    return results
+            yield key.format(idx, seq), prefix + seq + suffix
 
 
 def remove_one_bulge(seqs):
-    results = []
     key = 'RNA1bulge-{}position-{}'
     for idx, orig_seq in enumerate(seqs):
-        results.append((key.format(idx + 1, orig_seq), seqs[:idx] + seqs[idx + 1:]))
-
-    return results
-
-
-def get_input_file_and_wild(file_path):
+        yield key.format(idx + 1, orig_seq), seqs[:idx] + seqs[idx + 1:]
+
+
+def _format_key(name, positions, labels):
+    if len(positions) == 1:
+        return '{}-{}position-{}'.format(name, positions[0], labels[0])
+    return '{}-({})positions-({})'.format(name, ','.join(map(str, positions)), ','.join(labels))
+
+
+def _format_variant_key(seqs, deletions, positions, revised_seqs, gaps, inserted_seqs):
+    keys = []
+    if positions:
+        keys.append(_format_key('{}MM'.format(len(positions)), [idx + 1 for idx in positions],
+                                ['{}to{}'.format(seqs[idx], revised_seq)
+                                 for idx, revised_seq in zip(positions, revised_seqs)]))
+    if gaps:
+        keys.append(_format_key('DNA{}bulge'.format(len(gaps)), gaps, inserted_seqs))
+    if deletions:
+        keys.append(_format_key('RNA{}bulge'.format(len(deletions)), [idx + 1 for idx in deletions],
+                                [seqs[idx] for idx in deletions]))
+    return '+'.join(keys)
+
+
+def _iter_variants(seqs, mismatches, dna_bulges, rna_bulges, seen):
+    # (편집 내용, 변이) 를 만든다. 위치는 모두 원래 seqs 기준이고 DNA bulge 의 위치 g 는 seqs[g] 바로 앞에 끼워 넣는다는 뜻이다.
+    if mismatches + rna_bulges > len(seqs):
+        return
+
+    insertions = [(gaps, inserted_seqs)
+                  for gaps in combinations_with_replacement(range(1, len(seqs)), dna_bulges)
+                  for inserted_seqs in product(SEQUENCE_STRING, repeat=dna_bulges)]
+    for deletions in combinations(range(len(seqs)), rna_bulges):
+        deleted = list(seqs)
+        for idx in deletions:
+            deleted[idx] = ''
+        remaining = [idx for idx in range(len(seqs)) if idx not in deletions]
+        for positions in combinations(remaining, mismatches):
+            candidates = [SEQUENCE_STRING.replace(seqs[idx], '') for idx in positions]
+            for revised_seqs in product(*candidates):
+                replaced = deleted[:]
+                for idx, revised_seq in zip(positions, revised_seqs):
+                    replaced[idx] = revised_seq
+
+                for gaps, inserted_seqs in insertions:
+                    pieces = replaced[:]
+                    # 같은 위치에 여러 개를 넣을 때 순서가 유지되도록 뒤에서부터 앞에 붙인다.
+                    for gap, inserted_seq in zip(reversed(gaps), reversed(inserted_seqs)):
+                        pieces[gap] = inserted_seq + pieces[gap]
+                    variant = ''.join(pieces)
+                    if seen is not None:
+                        if variant in seen:
+                            continue
+                        seen.add(variant)
+                    yield (deletions, positions, revised_seqs, gaps, inserted_seqs), variant
+
+
+def generate_variants(seqs, mismatches=0, dna_bulges=0, rna_bulges=0):
+    # mismatch, DNA bulge(끼워 넣기), RNA bulge(빼기)를 정확히 주어진 갯수만큼 적용한 변이를 만든다.
+    # mismatch 만 있으면 위치를 오름차순 조합으로 고르고 원래 염기와 다른 염기만 쓰므로 중복이 생기지 않는다.
+    # bulge 가 섞이면 다른 조합이 같은 시퀀스가 될 수 있어서 set 으로 걸러낸다. (원래 seqs 와 같은 것도 뺀다)
+    seen = {seqs} if dna_bulges or rna_bulges else None
+    for edits, variant in _iter_variants(seqs, mismatches, dna_bulges, rna_bulges, seen):
+        yield _format_variant_key(seqs, *edits), variant
+
+
+def _budget_classes(mismatches, dna_bulges, rna_bulges):
+    # 각 갯수 이하의 모든 조합. 편집 수가 적은 것부터, 같으면 mismatch, DNA bulge, RNA bulge 순.
+    classes = product(range(mismatches + 1), range(dna_bulges + 1), range(rna_bulges + 1))
+    return sorted((c for c in classes if any(c)), key=lambda c: (sum(c), -c[0], -c[1]))
+
+
+def _iter_library(seqs, mismatches, dna_bulges, rna_bulges):
+    # 시퀀스가 같으면 먼저 나온 (편집 수가 적은) 것만 남긴다.
+    # mismatch 만 쓰면 갯수가 다른 변이끼리는 겹칠 수 없어서 set 을 만들지 않는다.
+    seen = {seqs} if dna_bulges or rna_bulges else None
+    for budget in _budget_classes(mismatches, dna_bulges, rna_bulges):
+        yield from _iter_variants(seqs, *budget, seen)
+
+
+def generate_library(seqs, mismatches, dna_bulges=0, rna_bulges=0):
+    # 각 갯수 이하의 모든 변이를 편집 수가 적은 것부터 만든다.
+    for edits, variant in _iter_library(seqs, mismatches, dna_bulges, rna_bulges):
+        yield _format_variant_key(seqs, *edits), variant
+
+
+def count_library(seqs, mismatches, dna_bulges=0, rna_bulges=0):
+    # mismatch 만 쓰면 C(n, k) * 3^k 의 합이고, bulge 가 있으면 겹치는 것을 빼야 해서 key 없이 한 번 세어 본다.
+    if not dna_bulges and not rna_bulges:
+        return sum(comb(len(seqs), k) * (len(SEQUENCE) - 1) ** k for k in range(1, min(mismatches, len(seqs)) + 1))
+    return sum(1 for _ in _iter_library(seqs, mismatches, dna_bulges, rna_bulges))
+
+
+def make_window(first_length=FIRST_SEQ, target_length=TARGET_SEQ_LENGTH, third_length=THIRD_SEQ - SECOND_SEQ,
+                forth_length=FORTH_SEQ - THIRD_SEQ):
+    # 길이로 get_partial_seqs 의 끝 위치들을 만든다. 마지막 값이 wild 길이이다.
+    second = first_length + target_length
+    third = second + third_length
+    return first_length, second, third, third + forth_length
+
+
+def get_input_file_and_wild(file_path, wild_length=FORTH_SEQ):
     results = []
     input_data = namedtuple('Input', 'file, wild')
     with open(os.path.join(os.getcwd(), BASE_FOLDER_NAME, INPUT_FOLDER_NAME, file_path), 'r') as f:
@@ -112,21 +213,22 @@ def get_input_file_and_wild(file_path):
             try:
                 file, wild_seq = line.split(':')
                 wild_seq = clean_seqs(wild_seq)
-                if not len(wild_seq) == 30:
+                if not len(wild_seq) == wild_length:
                     raise BufferError(wild_seq)
             except ValueError:
                 print('line : {} is wrong format! it should be FILE_NAME:WILD_SEQ.'.format(line))
                 continue
             except BufferError as e:
-                print(e.args[0] + ' should be 30 length.')
+                print(e.args[0] + ' should be {} length.'.format(wild_length))
                 continue
             else:
                 results.append(input_data(file, wild_seq.upper()))
     return results
 
 
-def get_partial_seqs(wild):
-    return wild[:FIRST_SEQ], wild[FIRST_SEQ:SECOND_SEQ], wild[SECOND_SEQ:THIRD_SEQ], wild[THIRD_SEQ:FORTH_SEQ]
+def get_partial_seqs(wild, window=WINDOW):
+    first, second, third, forth = window
+    return wild[:first], wild[first:second], wild[second:third], wild[third:forth]
 
 
 def check_duplicate(wild, output, third_seqs):
@@ -140,29 +242,142 @@ def check_duplicate(wild, output, third_seqs):
     return False
 
 
-def handle():
-    def bulk_write(data):
-        for key, seqs in data:
-            row_template = '{}:{}:{}'
+def build_wild_index(input_list, variant_lengths, third_length):
+    # check_duplicate 를 모든 wild 에 대해 한 번에 하기 위한 색인. {변이 길이: {key: wild 파일 이름 set}}
+    # key 는 wild 의 (길이만큼의 부분 시퀀스 + 바로 뒤 third 길이 구간에서 첫 염기를 뺀 것) 이다.
+    # 변이 + third 가 첫 염기만 빼고 어떤 wild 에 들어있다는 것과 (변이 + third[1:]) 이 그 wild 의 key 라는 것이 같다.
+    index = {}
+    for length in variant_lengths:
+        keys = index[length] = {}
+        for input_data in input_list:
+            wild = input_data.wild
+            for start in range(len(wild) - length - max(third_length, 1) + 1):
+                end = start + length
+                keys.setdefault(wild[start:end] + wild[end + 1:end + third_length], set()).add(input_data.file)
+    return index
+
+
+def find_wild_collisions(wild_index, seqs, third_seqs):
+    return wild_index.get(len(seqs), {}).get(seqs + third_seqs[1:], set())
+
+
+def collect_row_collisions(input_list, make_variants, window=WINDOW):
+    # 라이브러리 전체를 한 번 돌아서 행 시퀀스가 겹치는 곳을 모은다.
+    # duplicates: {guide 파일: {행: 그 guide 안에서 같은 행 갯수}} (2 이상만)
+    # shared_rows: {행: 그 행이 나오는 guide 파일 set} (두 guide 이상에서 나오는 행만)
+    # variant_lengths: 나온 변이 길이들 (wild 색인용)
+    duplicates = {}
+    shared_rows = {}
+    variant_lengths = set()
+    row_guides = {}
+    for input_data in input_list:
+        first_seqs, second_seqs, third_seqs, forth_seqs = get_partial_seqs(input_data.wild, window)
+        row_counts = Counter()
+        for _, seqs in make_variants(second_seqs):
+            row_counts[first_seqs + seqs + third_seqs + forth_seqs] += 1
+            variant_lengths.add(len(seqs))
+
+        for row, count in row_counts.items():
+            if count > 1:
+                duplicates.setdefault(input_data.file, {})[row] = count
+            guide = row_guides.setdefault(row, input_data.file)
+            if guide != input_data.file:
+                shared_rows.setdefault(row, {guide}).add(input_data.file)
+    return duplicates, shared_rows, variant_lengths
+
+
+def bulk_write(output_f, input_data, partial_seqs, data, buffer_size=WRITE_BUFFER_SIZE, wild_index=None,
+               duplicates=None, shared_rows=None):
+    # 행을 모아 두었다가 buffer_size 개마다 한 번에 쓴다.
+    # 자기 wild 와 겹치면 :wild, 다른 guide 의 wild 와 겹치면 :other_wild=파일들 을 붙인다. (색인이 없으면 :wild 만 본다)
+    # 같은 guide 안에 같은 시퀀스의 행이 더 있으면 :variant=같은 행 갯수,
+    # 다른 guide 의 변이와 시퀀스가 같으면 :other_variant=파일들 을 붙인다.
+    first_seqs, _, third_seqs, forth_seqs = partial_seqs
+    duplicates = duplicates or {}
+    shared_rows = shared_rows or {}
+    buffer = []
+    for key, seqs in data:
+        row = first_seqs + seqs + third_seqs + forth_seqs
+        row_template = '{}:{}:{}'
+        if wild_index is None:
             if check_duplicate(input_data.wild, seqs, third_seqs):
                 row_template += ':wild'
-            row_template += '\n'
+        else:
+            collisions = find_wild_collisions(wild_index, seqs, third_seqs)
+            if input_data.file in collisions:
+                row_template += ':wild'
+            if collisions - {input_data.file}:
+                row_template += ':other_wild=' + ','.join(sorted(collisions - {input_data.file}))
+        if row in duplicates:
+            row_template += ':variant={}'.format(duplicates[row])
+        if row in shared_rows:
+            row_template += ':other_variant=' + ','.join(sorted(shared_rows[row] - {input_data.file}))
+        row_template += '\n'
+
+        buffer.append(row_template.format(input_data.file, key, row))
+        if len(buffer) >= buffer_size:
+            output_f.write(''.join(buffer))
+            buffer = []
+
+    output_f.write(''.join(buffer))
 
-            output_f.writelines(row_template.format(input_data.file, key, first_seqs + seqs + third_seqs + forth_seqs))
 
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
+def generate_default_variants(seqs):
+    return chain(generate_one_mismatch(seqs), generate_two_mismatch(seqs), add_one_bulge(seqs), remove_one_bulge(seqs))
 
-    for input_data in get_input_file_and_wild(input('input file > ')):
-        with open(os.path.join(output_folder, _put_file_extension(input_data.file)), 'w') as output_f:
+
+def write_library(input_list, make_variants, folder, window=WINDOW):
+    # 두 번 돈다. 처음에는 행 시퀀스가 겹치는 곳과 변이 길이를 모아 wild 색인을 만들고,
+    # 다음에 변이를 다시 만들면서 겹치는 것을 표시해서 쓴다. 변이는 guide 마다 바로 만들어 쓰고 버린다.
+    duplicates, shared_rows, variant_lengths = collect_row_collisions(input_list, make_variants, window)
+    wild_index = build_wild_index(input_list, variant_lengths, window[2] - window[1])
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    for input_data in input_list:
+        with open(os.path.join(folder, _put_file_extension(input_data.file)), 'w') as output_f:
             # 4(first) + 20(19 or 21, second) + 3(third) + 4(forth)
-            first_seqs, second_seqs, third_seqs, forth_seqs = get_partial_seqs(input_data.wild)
+            partial_seqs = get_partial_seqs(input_data.wild, window)
+            bulk_write(output_f, input_data, partial_seqs, make_variants(partial_seqs[1]), wild_index=wild_index,
+                       duplicates=duplicates.get(input_data.file), shared_rows=shared_rows)
+
+
+def handle():
+    write_library(get_input_file_and_wild(input('input file > ')), generate_default_variants, output_folder)
+
+
+def _input_int(message, default):
+    value = input('{} (default {}) > '.format(message, default)).strip()
+    return int(value) if value else default
+
+
+def handle_custom():
+    file_path = input('input file > ')
+    mismatches = _input_int('max mismatches', 3)
+    dna_bulges = _input_int('max DNA bulges', 1)
+    rna_bulges = _input_int('max RNA bulges', 1)
+    lengths = input('window lengths first,target,third,forth (default {},{},{},{}) > '.format(
+        *(end - start for start, end in zip((0,) + WINDOW, WINDOW)))).strip()
+    window = make_window(*map(int, lengths.split(','))) if lengths else WINDOW
+
+    input_list = get_input_file_and_wild(file_path, wild_length=window[-1])
+    # 쓰기 전에 라이브러리 크기를 먼저 보여준다.
+    sizes = [count_library(get_partial_seqs(input_data.wild, window)[1], mismatches, dna_bulges, rna_bulges)
+             for input_data in input_list]
+    for input_data, size in zip(input_list, sizes):
+        print('{}: {} variants'.format(input_data.file, size))
+    print('total: {} variants'.format(sum(sizes)))
+    if input('write? (Y/n) > ').strip().lower() == 'n':
+        return
 
-            bulk_write(generate_one_mismatch(second_seqs))
-            bulk_write(generate_two_mismatch(second_seqs))
-            bulk_write(add_one_bulge(second_seqs))
-            bulk_write(remove_one_bulge(second_seqs))
+    write_library(input_list, partial(generate_library, mismatches=mismatches, dna_bulges=dna_bulges,
+                                      rna_bulges=rna_bulges), output_folder, window)
 
 
 if __name__ == '__main__':
-    handle()
+    # python generator.py custom : mismatch/bulge 갯수와 window 를 정해서 만든다.
+    if sys.argv[1:] == ['custom']:
+        handle_custom()
+    else:
+        handle()
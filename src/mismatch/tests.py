@@ -1,8 +1,13 @@
+import io
 import unittest
+from collections import namedtuple
 
 from src.mismatch.generator import (generate_one_mismatch, generate_two_mismatch, _select_two_index,
                                     _generate_sequence_combinations, add_one_bulge, remove_one_bulge, get_partial_seqs,
-                                    check_duplicate)
+                                    check_duplicate, generate_variants, generate_library, count_library, make_window,
+                                    build_wild_index, find_wild_collisions, bulk_write, collect_row_collisions)
+
+Input = namedtuple('Input', 'file, wild')
 
 
 def _factorial(a):
@@ -111,6 +116,99 @@ class TestCase(unittest.TestCase):
                                'GGG',
                                ])
 
+    def test_generate_variants_same_as_fixed_generators(self):
+        seqs = 'ATCGATCG'
+        self.assertCountEqual(generate_variants(seqs, 1), generate_one_mismatch(seqs))
+        self.assertCountEqual(generate_variants(seqs, 2), generate_two_mismatch(seqs))
+        self.assertCountEqual(generate_variants(seqs, rna_bulges=1), remove_one_bulge(seqs))
+        self.assertCountEqual({seqs for _, seqs in generate_variants(seqs, dna_bulges=1)},
+                              {seqs for _, seqs in add_one_bulge(seqs)})
+
+    def test_generate_variants_three_mismatch_length(self):
+        seqs = 'ATCGATCGATCG'
+        results = [seqs for _, seqs in generate_variants(seqs, 3)]
+        self.assertEqual(len(results), _combination(len(seqs), 3) * 27)
+        self.assertEqual(len(set(results)), len(results))
+
+    def test_generate_variants_bulges_should_not_duplicate(self):
+        results = [seqs for _, seqs in generate_variants('AACG', 1, 1, 1)]
+        self.assertEqual(len(set(results)), len(results))
+        self.assertNotIn('AACG', results)
+
+    def test_generate_variants_multi_bulge_key(self):
+        self.assertIn(('DNA2bulge-(1,1)positions-(G,T)', 'AGTC'), list(generate_variants('AC', dna_bulges=2)))
+        self.assertIn(('1MM-2position-CtoG+RNA1bulge-1position-A', 'GT'), list(generate_variants('ACT', 1, 0, 1)))
+
+    def test_generate_library(self):
+        seqs = 'ATCGAT'
+        results = [seqs for _, seqs in generate_library(seqs, 2, 1, 1)]
+        self.assertEqual(len(set(results)), len(results))
+        self.assertEqual(count_library(seqs, 2, 1, 1), len(results))
+        self.assertEqual(count_library(seqs, 2), len(list(generate_library(seqs, 2))))
+        # 1MM 은 2MM 보다 먼저 나온다.
+        self.assertTrue(next(generate_library(seqs, 2))[0].startswith('1MM'))
+
+    def test_get_partial_seqs_with_window(self):
+        seqs = 'AAATTTTTTTTTTTTTTTTTTTTTCCCGG'
+        self.assertEqual(make_window(), (4, 24, 27, 30))
+        self.assertCountEqual(get_partial_seqs(seqs, make_window(3, 21, 3, 2)),
+                              ['AAA',
+                               'TTTTTTTTTTTTTTTTTTTTT',
+                               'CCC',
+                               'GG',
+                               ])
+
+    def test_find_wild_collisions(self):
+        inputs = [Input('a', 'AAAATTTTTTTTTTTTTTTTTTTTCCCGGG'),
+                  Input('b', 'GGGGATTTTTTTTTTTTTTTTTTTGCCAAA')]
+        index = build_wild_index(inputs, {19, 20, 21}, 3)
+
+        self.assertSetEqual(find_wild_collisions(index, 'ATTTTTTTTTTTTTTTTTTT', 'CCC'), {'a', 'b'})
+        self.assertSetEqual(find_wild_collisions(index, 'ATTTTTTTTTTTTTTTTTTT', 'GGG'), set())
+        self.assertSetEqual(find_wild_collisions(index, 'TTTTTTTTTTTTTTTTTTTT', 'CCC'), {'a'})
+        self.assertSetEqual(find_wild_collisions(index, 'GTTTTTTTTTTTTTTTTTTTT', 'CCC'), set())
+        for seqs, third_seqs in [('ATTTTTTTTTTTTTTTTTTT', 'CCC'), ('TTTTTTTTTTTTTTTTTTT', 'ACC'),
+                                 ('GATTTTTTTTTTTTTTTTTTT', 'GCC')]:
+            self.assertSetEqual(find_wild_collisions(index, seqs, third_seqs),
+                                {i.file for i in inputs if check_duplicate(i.wild, seqs, third_seqs)})
+
+    def _make_variants(self, seqs):
+        return [('k1', seqs[:-1] + 'A'), ('k2', seqs[:-1] + 'A'), ('k3', 'C' + seqs[1:])]
+
+    def test_collect_row_collisions(self):
+        inputs = [Input('a', 'AAAATTTTTTTTTTTTTTTTTTTTCCCGGG'),
+                  Input('b', 'AAAATTTTTTTTTTTTTTTTTTTGCCCGGG'),
+                  Input('c', 'GGGGTTTTTTTTTTTTTTTTTTTTCCCGGG')]
+
+        duplicates, shared_rows, variant_lengths = collect_row_collisions(inputs, self._make_variants)
+
+        self.assertDictEqual(duplicates, {
+            'a': {'AAAATTTTTTTTTTTTTTTTTTTACCCGGG': 2},
+            'b': {'AAAATTTTTTTTTTTTTTTTTTTACCCGGG': 2},
+            'c': {'GGGGTTTTTTTTTTTTTTTTTTTACCCGGG': 2},
+        })
+        self.assertDictEqual(shared_rows, {'AAAATTTTTTTTTTTTTTTTTTTACCCGGG': {'a', 'b'}})
+        self.assertSetEqual(variant_lengths, {20})
+
+    def test_bulk_write_flags(self):
+        inputs = [Input('a', 'AAAATTTTTTTTTTTTTTTTTTTTCCCGGG'),
+                  Input('b', 'GGGGATTTTTTTTTTTTTTTTTTTGCCAAA'),
+                  Input('c', 'AAAATTTTTTTTTTTTTTTTTTTGCCCGGG')]
+        partial_seqs = get_partial_seqs(inputs[0].wild)
+        data = [('x', 'ATTTTTTTTTTTTTTTTTTT')] + self._make_variants(partial_seqs[1])
+        duplicates, shared_rows, _ = collect_row_collisions(inputs, self._make_variants)
+        output = io.StringIO()
+
+        bulk_write(output, inputs[0], partial_seqs, data, buffer_size=2, wild_index=build_wild_index(inputs, {20}, 3),
+                   duplicates=duplicates['a'], shared_rows=shared_rows)
+
+        self.assertListEqual(output.getvalue().splitlines(), [
+            'a:x:AAAAATTTTTTTTTTTTTTTTTTTCCCGGG:wild:other_wild=b,c',
+            'a:k1:AAAATTTTTTTTTTTTTTTTTTTACCCGGG:variant=2:other_variant=c',
+            'a:k2:AAAATTTTTTTTTTTTTTTTTTTACCCGGG:variant=2:other_variant=c',
+            'a:k3:AAAACTTTTTTTTTTTTTTTTTTTCCCGGG',
+        ])
+
     def test_check_duplicate(self):
         seqs = 'AAAATTTTTTTTTTTTTTTTTTTTCCCGGG'
 
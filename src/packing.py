@@ -0,0 +1,17 @@
+import itertools
+
+BASES = 'ACGT'
+
+# 4 염기를 1 바이트로 묶는다. A=00, C=01, G=10, T=11
+_PACK_TABLE = {''.join(bases): idx for idx, bases in enumerate(itertools.product(BASES, repeat=4))}
+_UNPACK_TABLE = [''.join(bases) for bases in itertools.product(BASES, repeat=4)]
+
+
+def pack_seqs(seqs):
+    # ACGT 로만 이루어진 대문자 시퀀스만 받는다. 길이는 따로 저장해야 한다.
+    padded = seqs + BASES[0] * (-len(seqs) % 4)
+    return bytes(_PACK_TABLE[padded[idx:idx + 4]] for idx in range(0, len(padded), 4))
+
+
+def unpack_seqs(data, length):
+    return ''.join(map(_UNPACK_TABLE.__getitem__, data))[:length]
@@ -0,0 +1,117 @@
+import re
+
+READ_BUFFER_SIZE = 4 * 1024 * 1024
+BATCH_SIZE = 10000
+
+SEQ_BYTES = b'ACGT'
+UPPER_TABLE = bytes.maketrans(b'acgt', b'ACGT')
+
+# 샘플 파일용. N 도 시퀀스로 본다.
+SAMPLE_SEQ_BYTES = b'ACGTN'
+SAMPLE_UPPER_TABLE = bytes.maketrans(b'acgtn', b'ACGTN')
+SEQ_PREFIX = re.compile(b'[ACGT]*')
+
+
+class InvalidFastqFormat(Exception):
+    pass
+
+
+def _read_fastq_lines(f, buffer_size):
+    # 큰 단위로 읽어서 줄로 나누고, 레코드(4줄) 단위로 끊어지는 만큼만 넘긴다.
+    lines = []
+    tail = b''
+    while True:
+        block = f.read(buffer_size)
+        if not block:
+            break
+
+        lines.extend((tail + block).split(b'\n'))
+        tail = lines.pop()
+        usable = len(lines) - len(lines) % 4
+        yield lines[:usable]
+        lines = lines[usable:]
+
+    if tail:
+        lines.append(tail)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    if len(lines) % 4:
+        raise InvalidFastqFormat('{} lines left at the end of file.'.format(len(lines)))
+    yield lines
+
+
+def read_fastq_batches(path, batch_size=BATCH_SIZE, buffer_size=READ_BUFFER_SIZE):
+    # 4줄 FASTQ 전용 리더. SeqRecord 를 만들지 않고 bytes 상태에서 검사, 대문자 변환을 한다.
+    # ACGT 이외의 문자가 있는 read 는 버리고, 대문자 str 로 batch_size 개씩 묶어서 돌려준다.
+    batch = []
+    with open(path, 'rb') as f:
+        for lines in _read_fastq_lines(f, buffer_size):
+            for header, seqs, plus, quality in zip(lines[0::4], lines[1::4], lines[2::4], lines[3::4]):
+                if not header.startswith(b'@') or not plus.startswith(b'+'):
+                    raise InvalidFastqFormat(header)
+
+                seqs = seqs.rstrip(b'\r')
+                if len(seqs) != len(quality.rstrip(b'\r')):
+                    raise InvalidFastqFormat(header)
+
+                seqs = seqs.translate(UPPER_TABLE)
+                if not seqs or seqs.translate(None, SEQ_BYTES):
+                    continue
+
+                batch.append(seqs.decode('ascii'))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+
+    if batch:
+        yield batch
+
+
+def _iter_line_blocks(path, block_size):
+    # 파일을 block_size 씩 읽어서 줄 중간에서 끊기지 않도록 마지막 줄바꿈까지 자른 block 을 돌려준다.
+    # 남은 조각은 다음 block 앞에 붙인다. block 안에 줄바꿈이 없을 만큼 긴 줄이면 줄바꿈이 나올 때까지 더 읽는다.
+    rest = b''
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(block_size)
+            if not chunk:
+                break
+
+            block = rest + chunk
+            end = block.rfind(b'\n') + 1
+            if not end:
+                rest = block
+                continue
+            rest = block[end:]
+            yield block[:end]
+
+    if rest:
+        yield rest
+
+
+def read_sample_batches(path, prefix=False, block_size=READ_BUFFER_SIZE):
+    # 추출된 샘플 파일(한 줄에 시퀀스 하나)을 block 마다 줄별 대문자 bytes 리스트로 돌려준다.
+    # 줄 수만큼 돌려주므로 길이를 더하면 전체 라인 수가 된다. 대문자 변환과 줄 나누기는 block 단위로 한 번에 한다.
+    # prefix=False: 앞뒤 공백을 지우고 A, C, G, T, N 으로만 되어있으면 그 시퀀스, 아니면 None
+    # prefix=True: 줄 앞에서부터 A, C, G, T 가 이어지는 부분 (없으면 b'')
+    for block in _iter_line_blocks(path, block_size):
+        block = block.translate(SAMPLE_UPPER_TABLE)
+        lines = block.split(b'\n')
+        if block.endswith(b'\n'):
+            lines.pop()
+
+        # block 전체가 시퀀스 문자와 줄바꿈뿐이면 줄마다 검사할 필요가 없다.
+        if not block.translate(None, SEQ_BYTES + b'\n'):
+            yield lines if prefix else [line or None for line in lines]
+        elif prefix:
+            yield [SEQ_PREFIX.match(line).group() for line in lines]
+        elif not block.translate(None, SAMPLE_SEQ_BYTES + b'\n'):
+            yield [line or None for line in lines]
+        else:
+            lines = [line.strip() for line in lines]
+            yield [line if line and not line.translate(None, SAMPLE_SEQ_BYTES) else None for line in lines]
+
+
+def read_sample_lines(path, prefix=False, block_size=READ_BUFFER_SIZE):
+    for batch in read_sample_batches(path, prefix, block_size):
+        yield from batch
@@ -0,0 +1,40 @@
+import unittest
+
+from src.barcode import build_barcode_table, get_kmers, get_minimizers, match_barcodes
+
+
+class MinimizerTest(unittest.TestCase):
+    def test_get_kmers(self):
+        self.assertListEqual(get_kmers('ATCGA', 3), ['ATC', 'TCG', 'CGA'])
+        self.assertListEqual(get_kmers('AT', 3), [])
+
+    def test_get_minimizers(self):
+        self.assertSetEqual(get_minimizers('TGCAT', 2, 2), {'GC', 'CA', 'AT'})
+
+    def test_barcode_shorter_than_window_should_have_no_minimizers(self):
+        self.assertSetEqual(get_minimizers('ATCGATCG', 5, 5), set())
+
+    def test_minimizers_of_barcode_should_be_in_read(self):
+        barcode = 'TTTGGTGCACACACATATA'
+        read = 'CTTGAAAAAGTGGCACCGAGTCGGTGCTTT' + barcode + 'ACTGGAACACAAAGCATAGCGGGGCG'
+
+        self.assertTrue(get_minimizers(barcode))
+        self.assertTrue(get_minimizers(barcode) <= get_minimizers(read))
+
+
+class MatchBarcodesTest(unittest.TestCase):
+    def test_build_barcode_table(self):
+        self.assertDictEqual(build_barcode_table({'a': 'atc', 'b': 'ATC', 'c': 'GGTA'}), {
+            3: {'ATC': ['a', 'b']},
+            4: {'GGTA': ['c']},
+        })
+
+    def test_match_barcodes(self):
+        barcode_table = build_barcode_table({'a': 'ATC', 'b': 'ATC', 'c': 'GGTA', 'd': 'CCCC'})
+
+        self.assertCountEqual(match_barcodes('TTGGTACATCG', barcode_table), ['a', 'b', 'c'])
+        self.assertListEqual(match_barcodes('TTTT', barcode_table), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
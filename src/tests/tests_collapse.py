@@ -0,0 +1,21 @@
+import unittest
+
+from src.collapse import collapse_seqs
+
+
+class CollapseSeqsTest(unittest.TestCase):
+    def test_collapse_in_memory_should_keep_first_seen_order(self):
+        self.assertListEqual(list(collapse_seqs(['AT', 'CG', 'AT', 'AT'])), [('AT', 3), ('CG', 1)])
+
+    def test_collapse_with_spill_should_merge_counts(self):
+        seqs_list = ['AT', 'CG', 'AT', 'GG', 'CG', 'AT', 'TT', 'GG', 'AT']
+
+        self.assertListEqual(list(collapse_seqs(seqs_list, limit=2)),
+                             [('AT', 4), ('CG', 2), ('GG', 2), ('TT', 1)])
+
+    def test_collapse_empty(self):
+        self.assertListEqual(list(collapse_seqs([], limit=2)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+
+from src.packing import pack_seqs, unpack_seqs
+
+
+class PackingTest(unittest.TestCase):
+    def test_pack_seqs(self):
+        self.assertEqual(pack_seqs('ACGT'), bytes([0b00011011]))
+        self.assertEqual(pack_seqs('TTTTC'), bytes([0b11111111, 0b01000000]))
+        self.assertEqual(pack_seqs(''), b'')
+
+    def test_unpack_should_restore_packed_seqs(self):
+        for seqs in ['', 'A', 'ACG', 'TTTTC', 'GATTACAGATTACA']:
+            packed = pack_seqs(seqs)
+            self.assertEqual(len(packed), (len(seqs) + 3) // 4)
+            self.assertEqual(unpack_seqs(packed, len(seqs)), seqs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+from src.reader import InvalidFastqFormat, read_fastq_batches, read_sample_lines
+
+
+def _write_temp_file(content, suffix):
+    f = tempfile.NamedTemporaryFile('wb', suffix=suffix, delete=False)
+    f.write(content)
+    f.close()
+    return f.name
+
+
+class TempFileTestCase(unittest.TestCase):
+    # 하위 클래스는 suffix 와 reader 를 정한다. _read 는 content 를 임시 파일로 쓰고 reader 로 끝까지 읽는다.
+    suffix = '.txt'
+
+    def setUp(self):
+        self.files = []
+
+    def tearDown(self):
+        for file in self.files:
+            os.remove(file)
+
+    def _read(self, content, **kwargs):
+        self.files.append(_write_temp_file(content, self.suffix))
+        return list(self.reader(self.files[-1], **kwargs))
+
+
+class ReadFastqBatchesTest(TempFileTestCase):
+    suffix = '.fastq'
+    reader = staticmethod(read_fastq_batches)
+
+    def test_should_skip_invalid_seqs_and_upper(self):
+        content = b'@r1\nacgT\n+\nIIII\n@r2\nACNT\n+\nIIII\n@r3\nGGA\n+r3\nIII\n'
+
+        self.assertListEqual(self._read(content), [['ACGT', 'GGA']])
+
+    def test_should_split_records_across_buffers_and_batches(self):
+        content = b''.join(b'@r\r\nACGTA\r\n+\r\nIIIII\r\n' for _ in range(5))
+
+        batches = self._read(content, batch_size=2, buffer_size=7)
+
+        self.assertListEqual(batches, [['ACGTA', 'ACGTA'], ['ACGTA', 'ACGTA'], ['ACGTA']])
+
+    def test_should_allow_missing_last_linebreak(self):
+        self.assertListEqual(self._read(b'@r1\nACGT\n+\nIIII'), [['ACGT']])
+        self.assertListEqual(self._read(b'@r1\nACGT\n+\nIIII\n\n\n'), [['ACGT']])
+
+    def test_should_raise_on_broken_format(self):
+        with self.assertRaises(InvalidFastqFormat):
+            self._read(b'@r1\nACGT\n+\nIIII\n@r2\nACGT\n')
+        with self.assertRaises(InvalidFastqFormat):
+            self._read(b'r1\nACGT\n+\nIIII\n')
+        with self.assertRaises(InvalidFastqFormat):
+            self._read(b'@r1\nACGT\n+\nIII\n')
+
+
+class ReadSampleLinesTest(TempFileTestCase):
+    suffix = '.txt'
+    reader = staticmethod(read_sample_lines)
+
+    def test_should_validate_and_upper_each_line(self):
+        content = b'acgt\nACNT \r\n\nACXT\nGG'
+
+        self.assertListEqual(self._read(content), [b'ACGT', b'ACNT', None, None, b'GG'])
+        self.assertListEqual(self._read(content, block_size=3), [b'ACGT', b'ACNT', None, None, b'GG'])
+
+    def test_prefix_should_keep_leading_seqs(self):
+        content = b'acgt\nACNT\r\n\nACGT ignored\n'
+
+        self.assertListEqual(self._read(content, prefix=True), [b'ACGT', b'AC', b'', b'ACGT'])
+
+    def test_empty_file(self):
+        self.assertListEqual(self._read(b''), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
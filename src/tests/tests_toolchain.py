@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import mongomock
+from click.testing import CliRunner
+from mongomock_motor import AsyncMongoMockClient
+
+import toolchain
+
+
+class MongoMockTestCase(unittest.TestCase):
+    # pymongo, motor 연결을 같은 mongomock 저장소로 바꿔서 mongodb 없이 돌린다.
+    def setUp(self):
+        self.client = mongomock.MongoClient()
+        patches = [
+            mock.patch.object(toolchain, 'connect_to_mongodb', return_value=self.client),
+            mock.patch.object(toolchain, 'connect_to_mongodb_with_motor',
+                              side_effect=lambda: AsyncMongoMockClient(mock_mongo_client=self.client)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class ExtractBarcodesTest(MongoMockTestCase):
+    def test_extract_barcodes_should_insert_reads_and_count(self):
+        db = self.client['test']
+        db['reads-joined'].insert_many([
+            {'seq': 'AAACCCGGGTTT'},
+            {'seq': 'TTTCCCAAA', 'count': 3},
+            {'seq': 'GGGGGGGG'},
+            {'seq': 'acccg'},
+        ])
+        barcode_maps = {'bc1': 'CCC', 'bc2': 'gggg', 'bc3': 'TATATA'}
+        done = []
+
+        dest_collname = toolchain.extract_barcodes('test', 'reads-joined', barcode_maps, done.append)
+
+        dest_coll = db[dest_collname]
+        self.assertEqual(sum(done), len(barcode_maps))
+        self.assertCountEqual([row['seq'] for row in dest_coll.find({'barcode_id': 'bc1'})],
+                              ['AAACCCGGGTTT', 'TTTCCCAAA', 'acccg'])
+        result_info = dest_coll.find_one({'_id': 'result_info'}, {'_id': 0})
+        self.assertDictEqual(result_info, {'bc1': 5, 'bc2': 1, 'bc3': 0})
+
+
+class InsertFilesTest(MongoMockTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.coll_info = {'_id': 'reads-joined', 'kmer_size': 0, 'kmer_window': 0, 'packed': False}
+
+    def _write(self, name, lines):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.writelines(line + '\n' for line in lines)
+        return path
+
+    def test_invalid_file_with_workers_should_raise_invalid_file_format(self):
+        files = [self._write('bad.csv', ['ACGT'])]
+        files += [self._write('good{}.txt'.format(idx), ['ACGTACGT'] * 20000) for idx in range(4)]
+
+        with self.assertRaises(toolchain.InvalidFileFormat):
+            toolchain.insert_files('test', files, self.coll_info, 1000, 2, 2, 2, 0, lambda _: None)
+        # 실패한 파일을 보자마자 멈추므로 나머지 파일을 다 넣지 않는다.
+        self.assertLess(self.client['test']['reads-joined'].count_documents({}), 80000)
+
+    def test_workers_should_insert_every_file(self):
+        files = [self._write('good{}.txt'.format(idx), ['ACGTACGT'] * 3000) for idx in range(3)]
+        done = []
+
+        report = toolchain.insert_files('test', files, self.coll_info, 1000, 2, 2, 2, 0, done.append)
+
+        self.assertEqual(report['docs'], 9000)
+        self.assertCountEqual(done, files)
+
+
+class DemuxFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.folder = os.path.join(self.tmp.name, 'demux')
+        os.mkdir(self.folder)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _read(self, folder, name):
+        with open(os.path.join(folder, name + '.txt')) as f:
+            return f.read()
+
+    def test_demux_files(self):
+        files = [
+            self._write('reads.txt', 'ACGTGGGTTT\nGGGTTTAA\nCCCC\nacgtcc\nNNNN\n'),
+            self._write('reads.fastq', '@r1\nTTGGGTTT\n+\nIIIIIIII\n@r2\nAACGTA\n+\nIIIIII\n'),
+        ]
+        barcode_maps = {'a': 'ACGT', 'b': 'acgt', 'c': 'GGGTTT', 'd': 'TTTT'}
+
+        # buffer_size 가 작아서 중간에 여러 번 나눠 쓴다.
+        counts = toolchain.demux_files(files, barcode_maps, self.folder, 2)
+
+        self.assertDictEqual(counts, {'a': 3, 'b': 3, 'c': 3, 'd': 0})
+        self.assertEqual(self._read(self.folder, 'a'), 'ACGTGGGTTT\nACGTCC\nAACGTA\n')
+        self.assertEqual(self._read(self.folder, 'b'), 'ACGTGGGTTT\nACGTCC\nAACGTA\n')
+        self.assertEqual(self._read(self.folder, 'c'), 'ACGTGGGTTT\nGGGTTTAA\nTTGGGTTT\n')
+        self.assertEqual(self._read(self.folder, 'd'), '')
+
+        expected_folder = os.path.join(self.tmp.name, 'expected')
+        os.mkdir(expected_folder)
+        toolchain.write_result_info(expected_folder, counts)
+        self.assertEqual(self._read(self.folder, 'result_info'), self._read(expected_folder, 'result_info'))
+        self.assertEqual(self._read(self.folder, 'result_info'), 'a : 3\nb : 3\nc : 3\nd : 0\n')
+
+
+class InsertJoinedDataTest(unittest.TestCase):
+    def test_pack_without_kmer_index_should_be_rejected(self):
+        result = CliRunner().invoke(toolchain.mongodb, ['insert-joined-data', '--pack', '--kmer-size', '0'])
+
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('--pack', result.output)
+        self.assertNotIn('디비명', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,22 +3,44 @@
 import asyncio
 import click
 import click_completion
+import gzip
 import itertools
+import multiprocessing
 import os
 import re
+import time
 import motor.motor_asyncio
 
-from Bio import SeqIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime
+from queue import Empty
 from pymongo import MongoClient
 from pymongo.errors import ServerSelectionTimeoutError
 
+from src.barcode import KMER_SIZE, KMER_WINDOW, build_barcode_table, get_minimizers, match_barcodes
+from src.collapse import COLLAPSE_LIMIT, collapse_seqs
+from src.packing import pack_seqs, unpack_seqs
+from src.reader import read_fastq_batches
+
 click_completion.init()
 
 ENV_MONGODB_KEY = 'CURRENT_MONGODB'
 
 MAX_THREAD_SIZE = 20
 
+INSERT_WORKER_SIZE = 4
+INSERT_QUEUE_SIZE = 8
+
+DEMUX_BUFFER_SIZE = 100000
+
+EXTRACT_BATCH_SIZE = 10000
+
+EXPORT_BATCH_SIZE = 10000
+EXPORT_BLOCK_SIZE = 10000
+EXPORT_WORKER_SIZE = 4
+
+COLL_INFO_NAME = 'coll_info'
+
 loop = asyncio.get_event_loop()
 
 
@@ -30,6 +52,10 @@ class DBConnectionFailed(Exception):
     pass
 
 
+class InvalidFileFormat(Exception):
+    pass
+
+
 def connect_to_mongodb():
     try:
         client = MongoClient('localhost', 27017)
@@ -58,23 +84,74 @@ def init(db_name):
     return connect_to_mongodb()[db_name]
 
 
-def bulk_insert(db, data, chunk_size, coll_name):
-    async def async_bulk_insert(coll, data):
-        await coll.insert_many(data, ordered=False)
+def bulk_insert(db, data, chunk_size, coll_name, workers=INSERT_WORKER_SIZE, queue_size=INSERT_QUEUE_SIZE):
+    # 파싱(producer)과 insert(consumer)를 크기가 제한된 큐로 이어서 계속 겹쳐 돌린다.
+    # 큐가 차면 파싱이 기다리므로 메모리에는 최대 queue_size + workers 개의 chunk 만 올라간다.
+    coll = db[coll_name]
+    # 중간에 실패했을 때 읽던 chunk 가 끝나길 기다릴 수 있도록 data 는 전용 스레드 하나에서만 읽는다.
+    reader = ThreadPoolExecutor(max_workers=1)
+    report = {'docs': 0, 'chunks': 0, 'queue_depth_samples': 0, 'queue_depth_sum': 0, 'max_queue_depth': 0,
+              'elapsed': 0.0}
+
+    def next_chunk():
+        return list(itertools.islice(data, chunk_size))
+
+    async def produce(queue):
+        while True:
+            chunked_data = await loop.run_in_executor(reader, next_chunk)
+            if not chunked_data:
+                break
+            await queue.put(chunked_data)
+
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def consume(queue):
+        while True:
+            report['queue_depth_samples'] += 1
+            report['queue_depth_sum'] += queue.qsize()
+            report['max_queue_depth'] = max(report['max_queue_depth'], queue.qsize())
+            chunked_data = await queue.get()
+            if chunked_data is None:
+                return
 
-    tasks = []
-    while True:
-        chunked_data = list(itertools.islice(data, chunk_size))
-        if not chunked_data:
-            break
-        tasks.append(async_bulk_insert(db[coll_name], chunked_data))
-        if len(tasks) >= MAX_THREAD_SIZE:
-            loop.run_until_complete(asyncio.wait(tasks))
-            tasks = []
+            await coll.insert_many(chunked_data, ordered=False)
+            report['docs'] += len(chunked_data)
+            report['chunks'] += 1
 
-    if tasks:
-        loop.run_until_complete(asyncio.wait(tasks))
-    return
+    async def run():
+        queue = asyncio.Queue(maxsize=queue_size)
+        tasks = [asyncio.ensure_future(produce(queue))]
+        tasks += [asyncio.ensure_future(consume(queue)) for _ in range(workers)]
+        try:
+            # 어느 한쪽이라도 실패하면 나머지가 큐에서 영원히 기다리지 않도록 바로 멈춘다.
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    start = time.perf_counter()
+    try:
+        loop.run_until_complete(run())
+    except BaseException:
+        # data 를 닫아야 data 쪽(파싱 프로세스 풀 등)이 정리된다. 읽던 chunk 가 끝나길 기다렸다가 닫는다.
+        reader.shutdown()
+        if hasattr(data, 'close'):
+            data.close()
+        raise
+    finally:
+        reader.shutdown()
+    report['elapsed'] = time.perf_counter() - start
+    return report
+
+
+def format_insert_report(report):
+    docs_per_sec = report['docs'] / report['elapsed'] if report['elapsed'] else 0
+    mean_queue_depth = float(report['queue_depth_sum']) / max(report['queue_depth_samples'], 1)
+    return '{} 개 insert, {:.0f} docs/sec, 큐 평균 {:.1f} / 최대 {} chunk'.format(
+        report['docs'], docs_per_sec, mean_queue_depth, report['max_queue_depth'])
 
 
 def find_all_file_with_path(path, extensions=('.fastq', '.txt')):
@@ -93,27 +170,149 @@ def is_valid_seq_line(line):
 
 
 def read_from_fastq_file(path):
-    with open(path, 'rU') as handle:
-        for line in SeqIO.parse(handle, 'fastq'):
-            if not is_valid_seq_line(str(line.seq)):
-                continue
-
+    for batch in read_fastq_batches(path):
+        for seqs in batch:
             yield {
-                'seq': str(line.seq).upper()
+                'seq': seqs
             }
 
 
 def read_from_txt_file(path):
     with open(path, 'r') as f:
         for line in f:
-            if not is_valid_seq_line(str(line)):
+            line = line.strip()
+            if not is_valid_seq_line(line):
                 continue
 
             yield {
-                'seq': str(line).upper()
+                'seq': line.upper()
             }
 
 
+def read_from_file(path):
+    if path.endswith('.fastq'):
+        return read_from_fastq_file(path)
+    elif path.endswith('.txt'):
+        return read_from_txt_file(path)
+    return None
+
+
+def attach_minimizers(data, kmer_size, kmer_window):
+    for row in data:
+        row['kmers'] = sorted(get_minimizers(row['seq'], kmer_size, kmer_window))
+        yield row
+
+
+def collapse_rows(data, limit):
+    for seqs, count in collapse_seqs((row['seq'] for row in data), limit):
+        yield {
+            'seq': seqs,
+            'count': count
+        }
+
+
+def parse_file(path, coll_info, collapse_limit=0):
+    # collapse_limit 이 0 이 아니면 파일 안의 같은 read 를 {'seq', 'count'} 하나로 합쳐서 넣는다.
+    data = read_from_file(path)
+    if data is not None and collapse_limit:
+        data = collapse_rows(data, collapse_limit)
+    if data is not None and coll_info['kmer_size']:
+        data = attach_minimizers(data, coll_info['kmer_size'], coll_info['kmer_window'])
+    if data is not None and coll_info['packed']:
+        data = pack_rows(data)
+    return data
+
+
+def parse_file_to_queue(path, queue, stop, chunk_size, coll_info, collapse_limit):
+    # 프로세스 풀에서 실행된다. 파싱한 데이터를 chunk 단위로 큐에 넣고, 끝나면 (path, None) 을 넣는다.
+    # 받는 쪽이 중간에 멈추면 stop 이 켜지므로 더 넣지 않고 끝낸다.
+    try:
+        data = parse_file(path, coll_info, collapse_limit)
+        if data is None:
+            raise InvalidFileFormat(path)
+
+        while not stop.is_set():
+            chunked_data = list(itertools.islice(data, chunk_size))
+            if not chunked_data:
+                break
+            queue.put((path, chunked_data))
+    finally:
+        if not stop.is_set():
+            queue.put((path, None))
+
+
+def read_from_workers(files, workers, chunk_size, coll_info, collapse_limit, on_file_done):
+    # 여러 파일을 프로세스 풀에서 나눠 파싱하고, 크기가 제한된 큐 하나로 모아서 순서대로 흘려보낸다.
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as executor:
+        queue = manager.Queue(maxsize=workers * 2)
+        stop = manager.Event()
+        futures = {file: executor.submit(parse_file_to_queue, file, queue, stop, chunk_size, coll_info, collapse_limit)
+                   for file in files}
+
+        try:
+            remaining = len(futures)
+            while remaining:
+                file, chunked_data = queue.get()
+                if chunked_data is None:
+                    # 끝 표시는 실패해도 오므로, 그 파일의 결과를 바로 확인해서 실패하면 다른 파일을 기다리지 않고 멈춘다.
+                    futures[file].result()
+                    remaining -= 1
+                    on_file_done(file)
+                    continue
+
+                for row in chunked_data:
+                    yield row
+        finally:
+            # 파일 하나가 실패하거나 insert 가 실패해서 중간에 close 되면 워커가 꽉 찬 큐에 막힌 채로 남아 풀이 끝나지 않는다.
+            # 멈추라고 알리고 큐를 비워서 막힌 put 을 풀어준 뒤, 아직 시작하지 않은 파일은 취소한다.
+            stop.set()
+            while True:
+                try:
+                    queue.get_nowait()
+                except Empty:
+                    break
+            executor.shutdown(cancel_futures=True)
+
+
+def pack_rows(data):
+    for row in data:
+        row['len'] = len(row['seq'])
+        row['seq'] = pack_seqs(row['seq'])
+        yield row
+
+
+def get_seq(row):
+    # 2bit 로 저장된 read 는 풀어서, 아니면 그대로 돌려준다.
+    if isinstance(row['seq'], bytes):
+        return unpack_seqs(row['seq'], row['len'])
+    return row['seq']
+
+
+def get_coll_info(db, collname):
+    coll_info = db[COLL_INFO_NAME].find_one({'_id': collname}) or {'_id': collname, 'kmer_size': 0}
+    coll_info.setdefault('packed', False)
+    return coll_info
+
+
+def get_files_with_path():
+    while True:
+        path = click.prompt('대상 폴더', type=str)
+        file_map = find_all_file_with_path(path)
+        for path, files in file_map.items():
+            click.echo('[{path}] 파일이 {len} 개 있습니다.'.format(path=path, len=len(files)))
+
+        if file_map and click.confirm('모두 맞나요?'):
+            break
+        else:
+            click.echo('경로에 파일이 없습니다. 종료하려면 Ctrl+D')
+
+    files_with_path = []
+    for path, files in file_map.items():
+        for file in files:
+            files_with_path.append('/'.join((path, file)))
+    return files_with_path
+
+
 def check_db_is_exist(client, dbname):
     return dbname in client.database_names()
 
@@ -123,9 +322,62 @@ def mongodb():
     pass
 
 
+def create_joined_coll(db, kmer_size, kmer_window, pack):
+    joined_collname = '{}-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), 'joined')
+    if not pack:
+        db[joined_collname].create_index([('seq', 'text')])
+    coll_info = {'_id': joined_collname, 'kmer_size': kmer_size, 'kmer_window': kmer_window, 'packed': pack}
+    if kmer_size:
+        db[joined_collname].create_index('kmers')
+    db[COLL_INFO_NAME].insert_one(coll_info)
+    return coll_info
+
+
+def read_from_files(files, coll_info, collapse_limit, on_file_done):
+    # 파일을 차례로 파싱해서 하나로 이어 흘려보낸다. 파일 하나를 다 읽을 때마다 on_file_done 을 부른다.
+    for file in files:
+        data = parse_file(file, coll_info, collapse_limit)
+        if data is None:
+            raise InvalidFileFormat(file)
+
+        yield from data
+        on_file_done(file)
+
+
+def insert_files(db_name, files, coll_info, chunk_size, workers, insert_workers, queue_size, collapse_limit,
+                 on_file_done):
+    # 모든 파일을 bulk_insert 하나로 넣어서 파일 경계에서 큐와 insert 작업을 다시 만들지 않는다.
+    db = connect_to_mongodb_with_motor()[db_name]
+    if workers > 1:
+        data = read_from_workers(files, workers, chunk_size, coll_info, collapse_limit, on_file_done)
+    else:
+        data = read_from_files(files, coll_info, collapse_limit, on_file_done)
+    return bulk_insert(db, data, chunk_size, coll_info['_id'], insert_workers, queue_size)
+
+
 @mongodb.command()
 @click.option('--chunk', default=10000, type=int, help='한번에 디비로 넣는 사이즈입니다. 컴퓨터 성능에 따라 조정하세요.')
-def insert_joined_data(chunk):
+@click.option('--kmer-size', default=KMER_SIZE, type=int,
+              help='extract 에서 쓸 k-mer 인덱스의 k 입니다. 0 이면 인덱스를 만들지 않습니다.')
+@click.option('--kmer-window', default=KMER_WINDOW, type=int,
+              help='minimizer 를 고르는 윈도우 크기입니다. 바코드 길이는 kmer-size + kmer-window - 1 이상이어야 합니다.')
+@click.option('--workers', default=1, type=int,
+              help='파일을 동시에 파싱할 프로세스 갯수입니다. 1 이면 파일을 하나씩 처리합니다.')
+@click.option('--insert-workers', default=INSERT_WORKER_SIZE, type=int, help='동시에 insert 하는 작업 갯수입니다.')
+@click.option('--queue-size', default=INSERT_QUEUE_SIZE, type=int,
+              help='insert 를 기다리는 chunk 를 최대 몇개까지 쌓아둘지 정합니다. 메모리 사용량을 제한합니다.')
+@click.option('--collapse', is_flag=True, help='파일 안의 같은 read 를 갯수(count)와 함께 하나로 합쳐서 넣습니다.')
+@click.option('--collapse-limit', default=COLLAPSE_LIMIT, type=int,
+              help='collapse 할 때 메모리에 들고 있을 서로 다른 read 갯수입니다. 넘치면 임시 파일로 내립니다.')
+@click.option('--pack', is_flag=True,
+              help='read 를 염기당 2bit 로 묶어서 저장합니다. 새 콜렉션을 만들 때만 적용됩니다.')
+def insert_joined_data(chunk, kmer_size, kmer_window, workers, insert_workers, queue_size, collapse,
+                       collapse_limit, pack):
+    if pack and not kmer_size:
+        # 2bit 로 묶으면 $regex 를 못 쓰므로 k-mer 인덱스가 없으면 바코드마다 콜렉션 전체를 가져와 풀어야 한다.
+        click.echo('--pack 은 k-mer 인덱스가 있어야 합니다. --kmer-size 를 0 보다 크게 주세요.')
+        click.get_current_context().abort()
+
     click.echo('data 를 mongodb에 집어넣는 작업을 시작합니다.')
 
     while True:
@@ -142,44 +394,29 @@ def insert_joined_data(chunk):
 
     os.environ[ENV_MONGODB_KEY] = db_name
 
-    while True:
-        path = click.prompt('대상 폴더', type=str)
-        file_map = find_all_file_with_path(path)
-        for path, files in file_map.items():
-            click.echo('[{path}] 파일이 {len} 개 있습니다.'.format(path=path, len=len(files)))
-
-        if file_map and click.confirm('모두 맞나요?'):
-            break
-        else:
-            click.echo('경로에 파일이 없습니다. 종료하려면 Ctrl+D')
-
-    files_with_path = []
-    for path, files in file_map.items():
-        for file in files:
-            files_with_path.append('/'.join((path, file)))
+    files_with_path = get_files_with_path()
 
     if click.confirm(u'기존에 있는 콜렉션에 합칠건가요?'):
         revised_coll_list = [coll for coll in db.collection_names() if coll.endswith('joined')]
         coll_maps = {idx + 1: coll_name for idx, coll_name in enumerate(revised_coll_list)}
         joined_collname = get_coll_name_by_index(coll_maps)
+        # 기존 콜렉션에 합칠 때는 그 콜렉션이 만들어질 때의 k-mer, 2bit 설정을 그대로 따른다.
+        coll_info = get_coll_info(db, joined_collname)
     else:
-        now = datetime.now()
-        joined_collname = '{}-{}'.format(now.strftime('%Y%m%d%H%M%S'), 'joined')
-        db[joined_collname].ensure_index([('seq', 'text')])
+        coll_info = create_joined_coll(db, kmer_size, kmer_window, pack)
 
-    db = connect_to_mongodb_with_motor()[db_name]
-    with click.progressbar(files_with_path) as files:
-        for file in files:
-            if file.endswith('.fastq'):
-                chunked_data = read_from_fastq_file(file)
-            elif file.endswith('.txt'):
-                chunked_data = read_from_txt_file(file)
-            else:
-                click.echo('잘못된 형식의 파일입니다.')
-                click.get_current_context().abort()
-                return
+    collapse_limit = collapse_limit if collapse else 0
+    with click.progressbar(length=len(files_with_path)) as bar:
+        try:
+            report = insert_files(db_name, files_with_path, coll_info, chunk, workers, insert_workers, queue_size,
+                                  collapse_limit, lambda _: bar.update(1))
+        except InvalidFileFormat:
+            click.echo('잘못된 형식의 파일입니다.')
+            click.get_current_context().abort()
+            return
 
-            bulk_insert(db, chunked_data, chunk, joined_collname)
+    if report:
+        click.echo(format_insert_report(report))
 
 
 def parse_barcode_file(file):
@@ -196,17 +433,35 @@ def parse_barcode_file(file):
     return barcode_maps
 
 
-async def select_mongodb_by_barcode(source_coll, dest_coll, key, barcode):
+def make_barcode_query(barcode, coll_info):
+    # 2bit 로 저장된 콜렉션은 $regex 를 쓸 수 없으므로 가져온 뒤 풀어서 확인한다.
+    query = {} if coll_info['packed'] else {'seq': {'$regex': barcode, '$options': 'i'}}
+    if coll_info['kmer_size']:
+        # 인덱스로 후보 read 만 가져오고, 실제 포함 여부는 다시 확인한다.
+        # 바코드가 윈도우보다 짧으면 minimizer 가 없으므로 전체 스캔으로 돌아간다.
+        minimizers = get_minimizers(barcode, coll_info['kmer_size'], coll_info['kmer_window'])
+        if minimizers:
+            query['kmers'] = {'$all': sorted(minimizers)}
+    return query
+
+
+async def select_mongodb_by_barcode(source_coll, dest_coll, key, barcode, coll_info):
+    # 찾은 read 를 한 문서에 모으지 않고 read 하나당 {'barcode_id': key, ...} 문서로 나눠서 batch 로 넣는다.
+    # 바코드 하나에 read 가 아무리 많아도 메모리에는 batch 하나만 올라가고 16MB 문서 제한에도 걸리지 않는다.
     barcode = barcode.upper()
-    # extracted_data = list(source_coll.find({'seq': {'$regex': barcode}}))
     data = []
-    async for row in source_coll.find({'seq': {'$regex': barcode, '$options': 'i'}}):
+    async for row in source_coll.find(make_barcode_query(barcode, coll_info), {'_id': 0, 'kmers': 0}):
+        if coll_info['packed'] and barcode not in get_seq(row):
+            continue
+
+        row['barcode_id'] = key
         data.append(row)
-    dest_coll.insert_one({
-        '_id': key,
-        'barcode': barcode,
-        'extracted_data': data
-    })
+        if len(data) >= EXTRACT_BATCH_SIZE:
+            await dest_coll.insert_many(data, ordered=False)
+            data = []
+
+    if data:
+        await dest_coll.insert_many(data, ordered=False)
 
 
 def get_db_name_by_index(db_maps):
@@ -259,11 +514,49 @@ def get_barcode_file():
         click.echo('해당 위치에 파일이 없습니다. 종료하려면 Ctrl+D')
 
 
-def upsert_result(coll):
-    for doc in coll.find({'_id': {'$ne': 'result_info'}}):
-        coll.update({'_id': 'result_info'},
-                    {'$set': {doc['_id']: len(doc['extracted_data'])}},
-                    upsert=True)
+def upsert_result(coll, keys):
+    # 바코드별 read 수를 서버에서 한번의 $group 으로 센다. collapse 된 read 는 count 만큼 센다.
+    result = {key: 0 for key in keys}
+    pipeline = [
+        {'$match': {'barcode_id': {'$exists': True}}},
+        {'$group': {'_id': '$barcode_id', 'count': {'$sum': {'$ifNull': ['$count', 1]}}}},
+    ]
+    for row in coll.aggregate(pipeline, allowDiskUse=True):
+        result[row['_id']] = row['count']
+    coll.update_one({'_id': 'result_info'}, {'$set': result}, upsert=True)
+
+
+def find_extracted_rows(coll, key, batch_size=EXPORT_BATCH_SIZE):
+    # 예전 형식(바코드당 문서 하나에 extracted_data 로 모아둔 것)도 읽는다.
+    legacy = coll.find_one({'_id': key, 'extracted_data': {'$exists': True}})
+    if legacy:
+        return legacy['extracted_data']
+    return coll.find({'barcode_id': key}, {'_id': 0, 'barcode_id': 0}).batch_size(batch_size)
+
+
+def extract_barcodes(dbname, collname, barcode_maps, on_done):
+    client = connect_to_mongodb()
+    coll_info = get_coll_info(client[dbname], collname)
+    dest_collname = '{}-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), 'extracted')
+    client[dbname][dest_collname].create_index('barcode_id')
+
+    motor_client = connect_to_mongodb_with_motor()
+    source_coll = motor_client[dbname][collname]
+    dest_coll = motor_client[dbname][dest_collname]
+    tasks = []
+    for key, barcode in barcode_maps.items():
+        tasks.append(select_mongodb_by_barcode(source_coll, dest_coll, key, barcode, coll_info))
+        if len(tasks) >= MAX_THREAD_SIZE:
+            loop.run_until_complete(asyncio.gather(*tasks))
+            on_done(len(tasks))
+            tasks = []
+
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks))
+        on_done(len(tasks))
+
+    upsert_result(client[dbname][dest_collname], barcode_maps)
+    return dest_collname
 
 
 @mongodb.command()
@@ -291,29 +584,56 @@ def extract():
     file = get_barcode_file()
 
     barcode_maps = parse_barcode_file(file)
-    now = datetime.now()
-    client = connect_to_mongodb_with_motor()
-    source_coll = client[dbname][collname]
-    dest_coll = client[dbname]['{}-{}'.format(now.strftime('%Y%m%d%H%M%S'), 'extracted')]
-    with click.progressbar(barcode_maps) as keys:
-        tasks = []
-        for key in keys:
-            barcode = barcode_maps[key]
-            tasks.append(select_mongodb_by_barcode(source_coll, dest_coll, key, barcode))
-            if len(tasks) >= MAX_THREAD_SIZE:
-                loop.run_until_complete(asyncio.wait(tasks))
-                tasks = []
-
-        if tasks:
-            loop.run_until_complete(asyncio.wait(tasks))
+    with click.progressbar(length=len(barcode_maps)) as bar:
+        extract_barcodes(dbname, collname, barcode_maps, bar.update)
+
+
+def format_rows(rows, expand):
+    for row in rows:
+        seqs = get_seq(row)
+        if 'count' not in row:
+            yield '{}\n'.format(seqs)
+        elif expand:
+            for _ in range(row['count']):
+                yield '{}\n'.format(seqs)
+        else:
+            yield '{} X {}\n'.format(seqs, row['count'])
 
-    client = connect_to_mongodb()
-    dest_coll = client[dbname]['{}-{}'.format(now.strftime('%Y%m%d%H%M%S'), 'extracted')]
-    upsert_result(dest_coll)
+
+def export_barcode(coll, key, folder, expand, batch_size, compress):
+    # cursor 에서 받는 대로 줄을 만들어 EXPORT_BLOCK_SIZE 줄씩 한번에 쓴다.
+    path = '{}/{}.txt'.format(folder, key)
+    if compress:
+        f = gzip.open(path + '.gz', 'wt')
+    else:
+        f = open(path, 'w')
+
+    with f:
+        lines = format_rows(find_extracted_rows(coll, key, batch_size), expand)
+        while True:
+            block = list(itertools.islice(lines, EXPORT_BLOCK_SIZE))
+            if not block:
+                break
+            f.write(''.join(block))
+    return key
+
+
+def export_extracted(coll, folder, keys, expand, batch_size, workers, compress, on_done):
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(export_barcode, coll, key, folder, expand, batch_size, compress) for key in keys]
+        for future in as_completed(futures):
+            on_done(future.result())
 
 
 @mongodb.command()
-def extract_to_file():
+@click.option('--expand/--no-expand', default=True,
+              help='collapse 된 read 를 갯수만큼 풀어서 씁니다. --no-expand 면 "시퀀스 X 갯수" 로 한줄씩 씁니다.')
+@click.option('--batch-size', default=EXPORT_BATCH_SIZE, type=int, help='db 에서 한번에 받아오는 read 갯수입니다.')
+@click.option('--workers', default=EXPORT_WORKER_SIZE, type=int, help='동시에 파일로 쓰는 바코드 갯수입니다.')
+@click.option('--gzip', 'compress', is_flag=True, help='바코드별 파일을 gzip 으로 압축해서 씁니다.')
+@click.option('--barcode', 'selected_keys', multiple=True,
+              help='지정한 바코드(바코드 파일의 이름)만 뽑습니다. 여러번 쓸 수 있습니다.')
+def extract_to_file(expand, batch_size, workers, compress, selected_keys):
     client = connect_to_mongodb()
 
     click.echo('mongodb에 있는 extract된 데이터를 파일로 뽑습니다.')
@@ -328,16 +648,76 @@ def extract_to_file():
     coll_maps = {idx + 1: coll_name for idx, coll_name in enumerate(revised_coll_list)}
     collname = get_coll_name_by_index(coll_maps)
 
+    coll = client[dbname][collname]
+    result_info = coll.find_one({'_id': 'result_info'}) or {}
+    result_info.pop('_id', None)
+
+    keys = list(result_info)
+    if selected_keys:
+        for key in selected_keys:
+            if key not in result_info:
+                click.echo('{} 는 없는 바코드입니다.'.format(key))
+        keys = [key for key in keys if key in selected_keys]
+
     os.mkdir(collname)
-    for data in client[dbname][collname].find():
-        with open('{}/{}.txt'.format(collname, data['_id']), 'w') as f:
-            if data['_id'] == 'result_info':
-                data.pop('_id')
-                for key, value in data.items():
-                    f.write('{} : {}\n'.format(key, value))
-            else:
-                for row in data['extracted_data']:
-                    f.write('{}\n'.format(row['seq']))
+    write_result_info(collname, result_info)
+    with click.progressbar(length=len(keys)) as bar:
+        export_extracted(coll, collname, keys, expand, batch_size, workers, compress, lambda _: bar.update(1))
+
+
+def write_result_info(folder, counts):
+    with open('{}/{}.txt'.format(folder, 'result_info'), 'w') as f:
+        for key, value in counts.items():
+            f.write('{} : {}\n'.format(key, value))
+
+
+def flush_demux_buffers(folder, buffers):
+    for key, lines in buffers.items():
+        if not lines:
+            continue
+        with open('{}/{}.txt'.format(folder, key), 'a') as f:
+            f.writelines(lines)
+        lines.clear()
+
+
+def demux_files(files, barcode_maps, folder, buffer_size):
+    # 파일을 한번만 읽으면서 read 마다 들어있는 바코드를 모두 찾아 바코드별 파일에 바로 쓴다.
+    # 바코드가 수천개라도 파일을 동시에 열어두지 않도록 버퍼에 모았다가 한꺼번에 이어쓴다.
+    barcode_table = build_barcode_table(barcode_maps)
+    counts = {key: 0 for key in barcode_maps}
+    buffers = {key: [] for key in barcode_maps}
+    for key in barcode_maps:
+        open('{}/{}.txt'.format(folder, key), 'w').close()
+
+    buffered = 0
+    for file in files:
+        for row in read_from_file(file):
+            for key in match_barcodes(row['seq'], barcode_table):
+                buffers[key].append(row['seq'] + '\n')
+                counts[key] += 1
+                buffered += 1
+
+            if buffered >= buffer_size:
+                flush_demux_buffers(folder, buffers)
+                buffered = 0
+
+    flush_demux_buffers(folder, buffers)
+    write_result_info(folder, counts)
+    return counts
+
+
+@mongodb.command()
+@click.option('--buffer', default=DEMUX_BUFFER_SIZE, type=int, help='파일로 한번에 쓰는 read 갯수입니다.')
+def demux(buffer):
+    click.echo('mongodb 를 거치지 않고 data 를 파일에 있는 각 barcode 별로 바로 나눕니다.')
+
+    files_with_path = get_files_with_path()
+    barcode_maps = parse_barcode_file(get_barcode_file())
+
+    folder = '{}-{}'.format(datetime.now().strftime('%Y%m%d%H%M%S'), 'demux')
+    os.mkdir(folder)
+    with click.progressbar(files_with_path) as files:
+        demux_files(files, barcode_maps, folder, buffer)
 
 if __name__ == '__main__':
     mongodb()